@@ -1,34 +1,187 @@
 """
 Advantage database backend for Django.
 
-Requires adsdb
+Requires adsdb, which is imported when the first connection is opened.
 """
 
 import re
-
-try:
-    import adsdb as Database
-except ImportError, e:
-    from django.core.exceptions import ImproperlyConfigured
-    raise ImproperlyConfigured("Error loading adsdb module: %s" % e)
+import time
 
 from django.db import utils
 from django.conf import settings
 from django.db.backends import *
 from django.db.backends.signals import connection_created
+from adsdb_django.driver import Database
 from adsdb_django.client import DatabaseClient
 from adsdb_django.creation import DatabaseCreation
 from adsdb_django.introspection import DatabaseIntrospection
 from adsdb_django.validation import DatabaseValidation
-from adsdb import ads_typecast_timestamp, ads_typecast_date, ads_typecast_time
+from adsdb_django.util import LRUCache
+from adsdb_django.pool import get_pool
+from adsdb_django.instrumentation import get_stats, get_slow_log
+from adsdb_django.converters import get_row_converter, get_column_converters, TYPE_CODE
+from adsdb_django.util import Column, get_numpy, int64_typecode
+from adsdb_django.transaction import Atomic
+from adsdb_django.resultcache import get_result_cache, CachedResult, PrefetchedResult
+from adsdb_django import parallel
+from adsdb_django.routing import get_replica_set, is_read_only, is_write
 
 from django.utils.safestring import SafeString, SafeUnicode
 
-Database.register_converter(Database.DT_TIMESTAMP, ads_typecast_timestamp)
-Database.register_converter(Database.DT_DATE, ads_typecast_date)
-Database.register_converter(Database.DT_TIME, ads_typecast_time)
-Database.register_converter(Database.DT_DECIMAL, util.typecast_decimal)
-Database.register_converter(Database.DT_BIT, lambda x: bool(x))
+# Settings understood by the backend itself, with their defaults. They may be
+# given in OPTIONS along with the adsdb connection parameters, but are removed
+# before the connection is opened.
+BACKEND_OPTIONS = {
+    # Number of converted queries kept by CursorWrapper.convert_query, 0 disables
+    'QueryCacheSize': 256,
+    # Number of rows fetched per round trip when iterating over a cursor
+    'FetchChunkSize': 100,
+    # Seconds between pings checking that a connection is still alive
+    'HealthCheckInterval': 30,
+    # Connection pool shared by the threads of a process, 0 disables
+    'PoolMaxSize': 0,
+    # Idle connections kept open regardless of PoolIdleTimeout
+    'PoolMinSize': 0,
+    'PoolIdleTimeout': 300,
+    'PoolMaxLifetime': 3600,
+    # Seconds to wait for a connection when the pool is exhausted
+    'PoolTimeout': 30,
+    # Rows sent per executemany call by SQLInsertCompiler.execute_bulk
+    'BulkInsertBatchSize': 500,
+    # Rows per statement of adsdb_django.helpers.chunked_update and
+    # chunked_delete
+    'ChunkedBatchSize': 10000,
+    # Tables whose SELECT results are cached, None disables the cache
+    'ResultCacheTables': None,
+    # Number of results kept, seconds they are kept for and the most rows a
+    # cached result may have
+    'ResultCacheSize': 1000,
+    'ResultCacheTTL': 300,
+    'ResultCacheMaxRows': 1000,
+    # Worker threads running the tasks given to DatabaseWrapper.submit
+    'AsyncWorkers': 8,
+    # Servers read-only statements are spread over, see routing.py
+    'DataSources': None,
+    # Seconds a server whose connection failed gets no reads
+    'ReplicaEjectTime': 30,
+    # Keep table, column and index metadata read by introspection in memory
+    'IntrospectionCache': True,
+    # Seconds the metadata is kept, so DDL run by other processes is seen
+    'IntrospectionCacheTTL': 60,
+    # Statements used by sql_flush: 'pack' (DELETE FROM and sp_PackTable,
+    # works with referential integrity) or 'zap' (sp_ZapTable, faster)
+    'FlushMode': 'pack',
+    # Keep the files of a new test database as a template for later runs
+    'TestDatabaseTemplate': False,
+    # Collect per statement timings and row counts, see instrumentation.py
+    'Instrumentation': False,
+    # Also count the bytes of fetched string values (costs a little more)
+    'InstrumentationBytes': False,
+    # Seconds after which a statement is recorded in the slow query log,
+    # None disables the log
+    'SlowQueryThreshold': None,
+    # Seconds after which the execution plan of a slow statement is stored,
+    # using SlowQueryPlanSQL with a %s for the quoted statement
+    'SlowQueryPlanThreshold': None,
+    'SlowQueryPlanSQL': None,
+    # Maximum number of slow queries recorded per second
+    'SlowQueryRate': 10,
+    # Full text indexes to create, {'app_label.ModelName': [field names]} or
+    # {'app_label.ModelName': {field name: {index options}}}
+    'FullTextIndexes': None,
+    # Compile iexact, icontains, istartswith and iendswith to compare
+    # UPPER(col) with UPPER(value) instead of relying on the collation
+    'CaseInsensitiveLookups': False,
+    # UPPER(col) indexes to create, {'app_label.ModelName': [field names]}
+    'CaseInsensitiveIndexes': None,
+    # Longest IN list compiled as one; longer ones become an OR of lists
+    'MaxInListSize': None,
+    # Values from which an IN list is loaded into a temporary table and
+    # compared with a subquery, None disables. Off by default: adsdb loads
+    # the values with one execute per row, see benchmarks/run.py in_list_table
+    'InListTableThreshold': None,
+}
+
+# Statements changing the schema, which invalidate cached table metadata
+ddl_re = re.compile(r'\s*(CREATE|DROP|ALTER)\s|\s*EXECUTE\s+PROCEDURE\s+sp_(Create|Drop|Modify|Rename)', re.I)
+
+# An IN or NOT IN list of placeholders, or an OR of IN lists on one column as
+# compiled for DatabaseOperations.max_in_list_size
+in_list_re = re.compile(r'\((?P<column>[^\s()]+) IN \(\?(?:, \?)*\)(?: OR (?P=column) IN \(\?(?:, \?)*\))+\)'
+                        r'|(?P<single>[^\s()]+)(?P<negated> NOT)? IN \(\?(?:, \?)*\)')
+
+def in_list_column_type(values):
+    """
+    Returns the column type of a temporary table holding the values of an IN
+    list, or None if they can't be stored in one.
+    """
+    if not [value for value in values
+            if not isinstance(value, (int, long)) or isinstance(value, bool) or
+               not -2**31 <= value < 2**31]:
+        return 'integer'
+    if not [value for value in values if not isinstance(value, basestring)]:
+        # Rounded up so that tables can be reused for lists of other lengths
+        length = 16
+        while length < max([len(value) for value in values]):
+            length *= 2
+        return 'nvarchar(%d)' % length
+    return None
+
+
+class InListTables(object):
+    """
+    The temporary tables of one connection holding the values of large IN
+    lists. Tables are emptied and reused rather than dropped, they go away
+    with the connection.
+
+    connection is the adsdb connection, so the statements managing the
+    tables bypass CursorWrapper: they neither invalidate introspection or
+    result cache entries nor pin the connection to the primary.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.free = {}
+        self.created = 0
+
+    def checkout(self, column_type, values):
+        "Returns a (column type, table name) handle for a table holding values."
+        names = self.free.get(column_type)
+        cursor = self.connection.cursor()
+        try:
+            if names:
+                name = names.pop()
+            else:
+                self.created += 1
+                name = '#adsdb_in_%d' % self.created
+                cursor.execute('CREATE TABLE %s (v %s)' % (name, column_type))
+            cursor.executemany('INSERT INTO %s (v) VALUES (?)' % name,
+                               [(value,) for value in values])
+        finally:
+            cursor.close()
+        return column_type, name
+
+    def checkin(self, handle):
+        column_type, name = handle
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute('DELETE FROM %s' % name)
+        finally:
+            cursor.close()
+        self.free.setdefault(column_type, []).append(name)
+
+
+# (array.array type code, NumPy dtype) used by fetch_columns for the fields
+# of DatabaseIntrospection.data_types_reverse. Columns of other types are
+# kept as lists. Without a 64 bit array type, big integers stay in a list.
+column_types = {
+    'IntegerField': ('l', None),
+    'BigIntegerField': (int64_typecode(), 'int64'),
+    'FloatField': ('d', None),
+    'DecimalField': ('d', None),
+    'NullBooleanField': ('b', None),
+    'DateField': (None, 'datetime64[D]'),
+    'DateTimeField': (None, 'datetime64[us]'),
+}
 
 
 class CursorWrapper(object):
@@ -41,28 +194,73 @@ class CursorWrapper(object):
     """
     codes_for_integrityerror = (1048,)
 
-    def __init__(self, cursor):
+    def __init__(self, cursor, db=None):
         self.cursor = cursor
+        self.db = db
+        # self.cursor is switched to a replica cursor or a cached result while
+        # one is in use; _base_cursor is the cursor owned by this wrapper.
+        self._base_cursor = cursor
+        # Statement of the current result set, for instrumentation
+        self._query = None
+        # RowConverter of the current result set, False until looked up
+        self._converter = False
+        self.stats = getattr(db, 'query_stats', None)
+        self.slow_log = getattr(db, 'slow_query_log', None)
+        self.result_cache = getattr(db, 'result_cache', None)
+        # Cursor of a replica connection the current result set comes from
+        self._replica_cursor = None
+        # (InListTables, handle) pairs used by the current statement
+        self._in_tables = []
 
     def __del__(self):
-        if self.cursor:
-            self.cursor.close()
-            self.cursor = None
+        self.close()
+
+    def close(self):
+        self._reset_cursor()
+        if self._in_tables:
+            self._release_in_tables()
+        if self._base_cursor:
+            self._base_cursor.close()
+            self._base_cursor = None
+        self.cursor = None
+
+    def _reset_cursor(self):
+        if self._replica_cursor is not None:
+            self._replica_cursor.close()
+            self._replica_cursor = None
+        # Also drops a replayed CachedResult or PrefetchedResult
+        self.cursor = self._base_cursor
 
     def convert_query(self, query, num_params):
         """
         Django uses "format" style placeholders, but Advantage uses "qmark" style.
         This fixes it -- but note that if you want to use a literal "%s" in a query,
         you'll need to use "%%s".
+
+        The result is kept in the connection's query cache, since the ORM runs
+        the same statements over and over.
         """
-        return query % tuple("?" * num_params)
+        cache = getattr(self.db, 'query_cache', None)
+        if cache is None:
+            return query % tuple("?" * num_params)
+        key = (query, num_params)
+        converted = cache.get(key)
+        if converted is None:
+            converted = query % tuple("?" * num_params)
+            cache.set(key, converted)
+        return converted
 
     def execute(self, query, args=()):
         try:
             try:
                 if args != None:
                     query = self.convert_query(query, len(args))
-                ret = self.cursor.execute(query, args)
+                if self.result_cache is None:
+                    return self._execute(query, args)
+                if self._execute_cached(query, args):
+                    return None
+                ret = self._execute(query, args)
+                self._written(query)
                 return ret
             except Database.OperationalError, e:
                 # Map some error codes to IntegrityError, since they seem to be
@@ -79,7 +277,21 @@ class CursorWrapper(object):
             try:
                 if len(args) > 0:
                     query = self.convert_query(query, len(args[0]))
-                    ret = self.cursor.executemany(query, args)
+                    self._reset_cursor()
+                    if self._in_tables:
+                        self._release_in_tables()
+                    if self.stats is None and self.slow_log is None:
+                        ret = self.cursor.executemany(query, args)
+                    else:
+                        start = time.time()
+                        ret = self.cursor.executemany(query, args)
+                        self._record(query, args[0], time.time() - start)
+                    self._query = query
+                    self._converter = False
+                    if self.db is not None:
+                        self.db.pin_primary()
+                    if self.result_cache is not None:
+                        self._written(query)
                     return ret
                 else:
                     return None
@@ -94,26 +306,317 @@ class CursorWrapper(object):
         except Database.DatabaseError, e:
             raise utils.DatabaseError(e)
 
+    def _execute(self, query, args):
+        if self._in_tables:
+            self._release_in_tables()
+        threshold = getattr(self.db, 'backend_options', BACKEND_OPTIONS)['InListTableThreshold']
+        if threshold and args and len(args) >= threshold and self.db is not None:
+            query, args = self._rewrite_in_lists(query, args, threshold)
+        if self.db is not None and self.db.replicas is not None:
+            # Temporary tables only exist on the primary
+            if not self._in_tables and self._execute_on_replica(query, args):
+                return None
+            if is_write(query):
+                self.db.pin_primary()
+        self._reset_cursor()
+        if self.stats is None and self.slow_log is None:
+            ret = self.cursor.execute(query, args)
+        else:
+            start = time.time()
+            ret = self.cursor.execute(query, args)
+            self._record(query, args, time.time() - start)
+        self._query = query
+        self._converter = False
+        if self.db is not None and ddl_re.match(query):
+            self.db.introspection.invalidate()
+        return ret
+
+    def _rewrite_in_lists(self, query, args, threshold):
+        """
+        Replaces IN lists of at least threshold placeholders by a subquery on
+        a temporary table holding their values, returning the new query and
+        parameters. Whether this is faster than sending the parameters with
+        the statement depends on the server, as adsdb's executemany makes a
+        round trip per value; measure before enabling InListTableThreshold.
+        """
+        tables = self.db.in_list_tables
+        # Placeholders are counted to find the parameters of each list, which
+        # is only safe if no literal in the statement contains a ?
+        if tables is None or query.count('?') != len(args):
+            return query, args
+        pieces = []
+        new_args = []
+        position = 0
+        arg_position = 0
+        for match in in_list_re.finditer(query):
+            before = query[position:match.start()]
+            count = before.count('?')
+            new_args.extend(args[arg_position:arg_position + count])
+            arg_position += count
+            count = match.group(0).count('?')
+            values = args[arg_position:arg_position + count]
+            arg_position += count
+            position = match.end()
+            column_type = None
+            if count >= threshold:
+                column_type = in_list_column_type(values)
+            if column_type is None:
+                pieces.append(before + match.group(0))
+                new_args.extend(values)
+                continue
+            handle = tables.checkout(column_type, values)
+            self._in_tables.append((tables, handle))
+            column = match.group('column') or match.group('single')
+            if match.group('negated'):
+                column += ' NOT'
+            pieces.append('%s%s IN (SELECT v FROM %s)' % (before, column, handle[1]))
+        if not self._in_tables:
+            return query, args
+        pieces.append(query[position:])
+        new_args.extend(args[arg_position:])
+        return ''.join(pieces), new_args
+
+    def _release_in_tables(self):
+        in_tables, self._in_tables = self._in_tables, []
+        for tables, handle in in_tables:
+            try:
+                tables.checkin(handle)
+            except Database.Error:
+                # The connection has been closed, and the table with it
+                pass
+
+    def _execute_on_replica(self, query, args):
+        """
+        Runs a read-only statement on a server chosen from the DataSources
+        option if the connection allows it. Returns False if the statement
+        must run on the primary, also when the chosen server failed. Only
+        the statement is timed for the node's latency, not opening the
+        connection.
+        """
+        node = self.db.read_node(query)
+        if node is None:
+            return False
+        self._reset_cursor()
+        # The server may have dropped a connection left idle, which doesn't
+        # make the node unhealthy, so such a connection is reopened once
+        retry = self.db.has_replica_connection(node)
+        while True:
+            try:
+                cursor = self.db.replica_connection(node).cursor()
+                start = time.time()
+                cursor.execute(query, args)
+                break
+            except (Database.OperationalError, Database.InterfaceError):
+                if not retry:
+                    self.db.eject_replica(node)
+                    return False
+                self.db.drop_replica_connection(node)
+                retry = False
+        duration = time.time() - start
+        self.db.replicas.record(node, duration)
+        if self.stats is not None or self.slow_log is not None:
+            self._record(query, args, duration)
+        self.cursor = self._replica_cursor = cursor
+        self._query = query
+        self._converter = False
+        return True
+
+    def _execute_cached(self, query, args):
+        """
+        Serves a SELECT on tables in the ResultCacheTables option from the
+        result cache, running and storing it on a miss. A result of more than
+        ResultCacheMaxRows rows isn't stored and is read from the server as
+        usual. Returns False, without running the statement, if it can't be
+        cached.
+        """
+        # Inside a transaction the results may include uncommitted changes
+        if self.db._in_transaction:
+            return False
+        cache = self.result_cache
+        tables = cache.select_tables(query)
+        if tables is None:
+            return False
+        key = (query, tuple(args or ()))
+        try:
+            result = cache.get(key, tables)
+        except TypeError:
+            # Unhashable parameters
+            return False
+        if result is None:
+            generations = cache.generations(tables)
+            self._execute(query, args)
+            # Reading one row more than a cached result may have tells
+            # whether this one fits, without loading a large result at once
+            rows = self.cursor.fetchmany(cache.max_rows + 1)
+            if len(rows) > cache.max_rows:
+                self.cursor = PrefetchedResult(rows, self.cursor)
+                return True
+            description = self.cursor.description
+            rows = self._convert(rows)
+            cache.set(key, generations, description, rows)
+            result = (description, rows)
+        self._reset_cursor()
+        self.cursor = CachedResult(*result)
+        self._query = query
+        self._converter = None
+        return True
+
+    def _written(self, query):
+        """
+        Invalidates the cached results of the tables a statement changed. They
+        are invalidated again at commit, as other connections may have cached
+        the old rows in the meantime.
+        """
+        tables = self.result_cache.written_tables(query)
+        if tables:
+            self.result_cache.invalidate(tables)
+            self.db._written_tables.update(tables)
+
+    def _record(self, query, args, duration):
+        if self.stats is not None:
+            self.stats.record_execute(query, args, duration)
+        if self.slow_log is not None and duration >= self.slow_log.threshold:
+            self.slow_log.record(self.db.connection, query, args, duration)
+
     def __getattr__(self, attr):
         if attr in self.__dict__:
             return self.__dict__[attr]
         else:
             return getattr(self.cursor, attr)
 
+    def _convert(self, rows):
+        """
+        Converts fetched rows to Python types with the converter for the
+        shape of the current result set.
+        """
+        converter = self._converter
+        if converter is False:
+            converter = self._converter = get_row_converter(self.cursor.description)
+        if converter is None:
+            return rows
+        return converter.convert(rows)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is None:
+            return row
+        if self.stats is not None:
+            self.stats.record_fetch(self._query, (row,))
+        return self._convert([row])[0]
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        if self.stats is not None:
+            self.stats.record_fetch(self._query, rows)
+        return self._convert(rows)
+
+    def fetchmany(self, size=None):
+        if size is None:
+            size = self.fetch_chunk_size()
+        rows = self.cursor.fetchmany(size)
+        if self.stats is not None:
+            self.stats.record_fetch(self._query, rows)
+        if not rows:
+            # Django stops reading a result set when it gets
+            # DatabaseFeatures.empty_fetchmany_value back
+            return []
+        return self._convert(rows)
+
+    def fetch_columns(self, size=None, use_numpy=None):
+        """
+        Fetches the rest of the result set as a list of Column objects, one
+        per result column, holding the values in a compact buffer with a
+        separate null mask.
+
+        Integer, float, decimal and boolean columns are stored in
+        array.array buffers (decimals as floats). With NumPy installed, or
+        use_numpy=True, all buffers are NumPy arrays instead, with dates and
+        timestamps as datetime64. Other columns are kept as lists.
+        """
+        if use_numpy is None:
+            use_numpy = get_numpy() is not None
+        elif use_numpy and get_numpy() is None:
+            raise ImportError("NumPy is not installed")
+
+        # Rows are read from the adsdb cursor and transposed once; each
+        # column's values are converted straight into its buffer. Results
+        # replayed from the result cache are converted already.
+        if self._converter is None:
+            converters = {}
+        else:
+            converters = get_column_converters()
+        columns = []
+        for column in self.cursor.description or ():
+            code = field_type = None
+            if len(column) > TYPE_CODE:
+                code = column[TYPE_CODE]
+                field_type = DatabaseIntrospection.data_types_reverse.get(code)
+            typecode, dtype = column_types.get(field_type, (None, None))
+            convert = converters.get(code)
+            if typecode == 'd':
+                # Decimals are stored as floats, parse the strings directly
+                convert = float
+            columns.append((Column(column[0], typecode, dtype), convert))
+        fetch_converters = []
+        for column, convert in columns:
+            if use_numpy and column.typecode is None and column.dtype is not None:
+                # NumPy parses date and timestamp strings itself, see
+                # Column.to_numpy
+                convert = None
+            fetch_converters.append(convert)
+        if size is None:
+            size = self.fetch_chunk_size()
+        while True:
+            rows = self.cursor.fetchmany(size)
+            if self.stats is not None:
+                self.stats.record_fetch(self._query, rows)
+            if not rows:
+                break
+            for (column, unused), convert, values in zip(columns, fetch_converters,
+                                                         zip(*rows)):
+                column.extend(values, convert)
+        if use_numpy:
+            for column, convert in columns:
+                column.to_numpy(convert)
+        return [column for column, convert in columns]
+
+    def fetch_chunk_size(self):
+        options = getattr(self.db, 'backend_options', BACKEND_OPTIONS)
+        return options['FetchChunkSize']
+
     def __iter__(self):
-        return iter(self.cursor.fetchall())
+        """
+        Streams the result set in chunks of FetchChunkSize rows instead of
+        loading it into memory all at once.
+        """
+        size = self.fetch_chunk_size()
+        while True:
+            rows = self.fetchmany(size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
 
 class DatabaseFeatures(BaseDatabaseFeatures):
+    # Must match what CursorWrapper.fetchmany returns at the end of a result
     empty_fetchmany_value = []
     update_can_self_select = False
     allows_group_by_pk = False
     related_fields_match_type = True
     uses_custom_query_class = True
     interprets_empty_strings_as_nulls = False
+    uses_savepoints = True
+
+    def _supports_transactions(self):
+        "Advantage tables take part in transactions; no need to probe with a table"
+        return True
 
 class DatabaseOperations(BaseDatabaseOperations):
     compiler_module = "adsdb_django.compiler"
     ads_table_type = 'ADT'
+    flush_mode = 'pack'
+    case_insensitive_lookups = False
+    in_list_limit = None
 
     def date_extract_sql(self, lookup_type, field_name):
         """
@@ -179,6 +682,17 @@ class DatabaseOperations(BaseDatabaseOperations):
         cursor.execute('SELECT LASTAUTOINC( connection ) from system.iota')
         return cursor.fetchone()[0]
     
+    def lookup_cast(self, lookup_type):
+        if (self.case_insensitive_lookups and
+            lookup_type in ('iexact', 'icontains', 'istartswith', 'iendswith')):
+            # Matches the UPPER(col) indexes made for CaseInsensitiveIndexes
+            return "UPPER(%s)"
+        return "%s"
+
+    def max_in_list_size(self):
+        "Returns the MaxInListSize option."
+        return self.in_list_limit
+
     def max_name_length(self):
         """
         Returns the maximum length of table and column names, or None if there
@@ -250,9 +764,10 @@ class DatabaseOperations(BaseDatabaseOperations):
 
     def savepoint_commit_sql(self, sid):
         """
-        Returns the SQL for committing the given savepoint.
+        Advantage has no RELEASE SAVEPOINT; savepoints are released when the
+        transaction ends, so there is nothing to run.
         """
-        return 'COMMIT'
+        return None
 
     def savepoint_rollback_sql(self, sid):
         """
@@ -266,16 +781,34 @@ class DatabaseOperations(BaseDatabaseOperations):
         the given database tables (without actually removing the tables
         themselves).
         """
-        if tables:
-            sql = ''
-            # Zap table would work, but DELETE FROM then PACK works if RI is enabled
+        sql = []
+        if self.flush_mode == 'zap':
+            # sp_ZapTable empties the table files and resets autoinc values in
+            # one step, but fails on tables with referential integrity rules
+            for table in tables:
+                sql.append('EXECUTE PROCEDURE sp_ZapTable( %s );' % self.squote_name(table))
+        else:
+            # DELETE FROM then PACK works if RI is enabled
             # Use sp_PackTable to reset autoinc values, fast since all records are gone
-            # UNRESOLVED PF - pack may be slow if the table is large, better way to do this?
             for table in tables:
                 sql.append('DELETE FROM %s;' % self.quote_name(table))
-                sql.append('EXECUTE PROCEDURE sp_PackTable( %s );' % self.quote_name(table))
+                sql.append('EXECUTE PROCEDURE sp_PackTable( %s );' % self.squote_name(table))
+        return sql
+
+    def year_lookup_bounds(self, value):
+        """
+        Django compiles __year lookups to "col BETWEEN %s AND %s" on the raw
+        column, which can use an index. Advantage timestamps only have
+        millisecond precision, so the upper bound must not have more digits.
+        """
+        first = '%s-01-01 00:00:00'
+        second = '%s-12-31 23:59:59.999'
+        return [first % value, second % value]
 
-            return sql
+    def year_lookup_bounds_for_date_field(self, value):
+        first = '%s-01-01'
+        second = '%s-12-31'
+        return [first % value, second % value]
 
     def value_to_db_datetime(self, value):
         if value is None:
@@ -315,6 +848,13 @@ class DatabaseWrapper(BaseDatabaseWrapper):
         'endswith': "LIKE %s ESCAPE '\\'",
         'iendswith': "LIKE %s ESCAPE '\\'"
     }
+    # Used instead of the above with the CaseInsensitiveLookups option
+    upper_operators = {
+        'iexact': '= UPPER(%s)',
+        'icontains': "LIKE UPPER(%s) ESCAPE '\\'",
+        'istartswith': "LIKE UPPER(%s) ESCAPE '\\'",
+        'iendswith': "LIKE UPPER(%s) ESCAPE '\\'",
+    }
 
     def __init__(self, *args, **kwargs):
         super(DatabaseWrapper, self).__init__(*args, **kwargs)
@@ -327,41 +867,321 @@ class DatabaseWrapper(BaseDatabaseWrapper):
         self.introspection = DatabaseIntrospection(self)
         self.validation = DatabaseValidation(self)
 
+        options = self.settings_dict['OPTIONS']
+        self.backend_options = dict([(name, options.get(name, default))
+                                     for name, default in BACKEND_OPTIONS.items()])
+        self.query_cache = None
+        if self.backend_options['QueryCacheSize']:
+            self.query_cache = LRUCache(self.backend_options['QueryCacheSize'])
+        self.ops.flush_mode = self.backend_options['FlushMode']
+        self.ops.in_list_limit = self.backend_options['MaxInListSize']
+        if self.backend_options['CaseInsensitiveLookups']:
+            self.ops.case_insensitive_lookups = True
+            self.operators = dict(self.operators)
+            self.operators.update(self.upper_operators)
+        self.query_stats = None
+        if self.backend_options['Instrumentation']:
+            self.query_stats = get_stats(self.alias,
+                                         self.backend_options['InstrumentationBytes'])
+        self.slow_query_log = None
+        if self.backend_options['SlowQueryThreshold'] is not None:
+            self.slow_query_log = get_slow_log(self.alias,
+                self.backend_options['SlowQueryThreshold'],
+                plan_threshold=self.backend_options['SlowQueryPlanThreshold'],
+                plan_sql=self.backend_options['SlowQueryPlanSQL'],
+                rate=self.backend_options['SlowQueryRate'])
+        self.result_cache = None
+        if self.backend_options['ResultCacheTables']:
+            self.result_cache = get_result_cache(self.alias,
+                self.backend_options['ResultCacheTables'],
+                size=self.backend_options['ResultCacheSize'],
+                ttl=self.backend_options['ResultCacheTTL'],
+                max_rows=self.backend_options['ResultCacheMaxRows'])
+        # Cached tables changed by the current transaction
+        self._written_tables = set()
+        self.replicas = None
+        if self.backend_options['DataSources']:
+            self.replicas = get_replica_set(self.alias,
+                self.backend_options['DataSources'], self._connection_params(),
+                eject_time=self.backend_options['ReplicaEjectTime'])
+        # Replica node name -> (connection, PooledConnection or None)
+        self._replica_connections = {}
+        # Set by the first write, after which reads stay on the primary too
+        self._primary_pinned = False
+        self.in_list_tables = None
+        self.pool = None
+        self.pooled_connection = None
+        self._last_checked = 0
+        # adsdb runs every statement in autocommit mode until a transaction is
+        # started explicitly
+        self._in_transaction = False
+        self._transaction_pending = False
+        # One entry per open DatabaseWrapper.atomic() block, see transaction.py
+        self.atomic_blocks = []
+
     def _valid_connection(self):
         if self.connection is not None:
+            # Pinging costs a round trip, so only do it now and then
+            now = time.time()
+            if now - self._last_checked < self.backend_options['HealthCheckInterval']:
+                return True
             try:
                 self.connection.con()
+                self._last_checked = now
                 return True
-            except InterfaceError:
-                self.connection.close()
-                self.connection = None
+            except Database.InterfaceError:
+                self.close(discard=True)
         return False
 
+    def close(self, discard=False):
+        """
+        Closes the connection, or gives it back to the pool if it came from
+        one. discard forces a pooled connection to be closed.
+        """
+        self._close_replicas()
+        self._primary_pinned = False
+        if self.pooled_connection is None:
+            self.in_list_tables = None
+            super(DatabaseWrapper, self).close()
+            self._in_transaction = self._transaction_pending = False
+            return
+
+        if self.is_dirty() or self._in_transaction:
+            # Never hand out a connection with a transaction in progress
+            try:
+                self._rollback()
+            except Database.Error:
+                discard = True
+        self.pool.checkin(self.pooled_connection, discard)
+        self.pooled_connection = None
+        self.in_list_tables = None
+        self.connection = None
+        self._in_transaction = self._transaction_pending = False
+
+    def _connect(self, kwargs):
+        """
+        Opens a connection or borrows one from the pool. Returns True if a new
+        connection was opened.
+        """
+        options = self.backend_options
+        if not options['PoolMaxSize']:
+            self.connection = Database.connect(**kwargs)
+            if options['InListTableThreshold']:
+                self.in_list_tables = InListTables(self.connection)
+            return True
+
+        if self.pool is None:
+            self.pool = self._get_pool(kwargs)
+        self.pooled_connection = self.pool.checkout()
+        self.connection = self.pooled_connection.connection
+        # Temporary tables live as long as the connection, so they are kept
+        # with it while it sits in the pool
+        info = self.pooled_connection.info
+        if 'in_list_tables' not in info and options['InListTableThreshold']:
+            info['in_list_tables'] = InListTables(self.connection)
+        self.in_list_tables = info.get('in_list_tables')
+        return self.pooled_connection.uses == 1
+
+    def _get_pool(self, kwargs):
+        "Returns the pool of connections opened with the given parameters."
+        options = self.backend_options
+        return get_pool(kwargs, lambda: Database.connect(**kwargs),
+                        min_size=options['PoolMinSize'],
+                        max_size=options['PoolMaxSize'],
+                        idle_timeout=options['PoolIdleTimeout'],
+                        max_lifetime=options['PoolMaxLifetime'],
+                        health_check_interval=options['HealthCheckInterval'],
+                        timeout=options['PoolTimeout'])
+
+    def _connection_params(self):
+        "Returns the adsdb.connect parameters of the primary server."
+        kwargs = {}
+        settings_dict = self.settings_dict
+        if settings_dict['USER']:
+            kwargs['UserID'] = settings_dict['USER']
+        if settings_dict['NAME']:
+            kwargs['DataSource'] = settings_dict['NAME']
+        if settings_dict['PASSWORD']:
+            kwargs['PASSWORD'] = settings_dict['PASSWORD']
+        kwargs.update(settings_dict['OPTIONS'])
+        for name in BACKEND_OPTIONS:
+            kwargs.pop(name, None)
+        return kwargs
+
+    def read_node(self, query):
+        """
+        Returns the replica node to run a statement on, or None if it must
+        run on the primary.
+        """
+        if (self.replicas is None or self._primary_pinned or
+            self._in_transaction or self._transaction_pending or
+            self.is_managed() or not is_read_only(query)):
+            return None
+        return self.replicas.choose()
+
+    def pin_primary(self):
+        """
+        Sends all statements to the primary until the connection is closed,
+        so that reads see the changes made through it.
+        """
+        self._primary_pinned = True
+
+    def replica_connection(self, node):
+        "Returns this thread's connection to a replica node, opening it if needed."
+        entry = self._replica_connections.get(node.name)
+        if entry is None:
+            if self.backend_options['PoolMaxSize']:
+                record = self._get_pool(node.params).checkout()
+                entry = (record.connection, record)
+            else:
+                entry = (Database.connect(**node.params), None)
+            self._replica_connections[node.name] = entry
+        return entry[0]
+
+    def has_replica_connection(self, node):
+        return node.name in self._replica_connections
+
+    def drop_replica_connection(self, node):
+        "Closes this thread's connection to a replica node after an error."
+        entry = self._replica_connections.pop(node.name, None)
+        if entry is not None:
+            self._close_replica(node.params, entry, discard=True)
+
+    def eject_replica(self, node):
+        "Drops the connection to a failed replica node and ejects it."
+        self.drop_replica_connection(node)
+        self.replicas.eject(node)
+
+    def _close_replica(self, params, entry, discard=False):
+        connection, record = entry
+        if record is not None:
+            self._get_pool(params).checkin(record, discard)
+        else:
+            try:
+                connection.close()
+            except Database.Error:
+                pass
+
+    def _close_replicas(self):
+        if not self._replica_connections:
+            return
+        params = dict([(node.name, node.params) for node in self.replicas.nodes])
+        for name, entry in self._replica_connections.items():
+            self._close_replica(params[name], entry)
+        self._replica_connections = {}
+
     def _cursor(self):
         if not self._valid_connection():
-            kwargs = {}
-            links = {}
+            kwargs = self._connection_params()
             settings_dict = self.settings_dict
-            if settings_dict['USER']:
-                kwargs['UserID'] = settings_dict['USER']
-            if settings_dict['NAME']:
-                kwargs['DataSource'] = settings_dict['NAME']
-            if settings_dict['PASSWORD']:
-                kwargs['PASSWORD'] = settings_dict['PASSWORD']
-            kwargs.update(settings_dict['OPTIONS'])
             # Save the table type
             self.ops.ads_table_type = settings_dict['OPTIONS']['TableType']
             if self.ops.ads_table_type == None:
                 # default to ADT if the table type wasn't specified
                 self.ops.ads_table_type = 'ADT'
-            self.connection = Database.connect(**kwargs)
-            connection_created.send(sender=self.__class__)
-        cursor = CursorWrapper(self.connection.cursor())
+            created = self._connect(kwargs)
+            self._last_checked = time.time()
+            if created:
+                connection_created.send(sender=self.__class__)
+        cursor = CursorWrapper(self.connection.cursor(), self)
+        if self._transaction_pending:
+            self._transaction_pending = False
+            cursor.execute('BEGIN TRANSACTION')
+            self._in_transaction = True
 
         return cursor
 
+    def _begin(self):
+        """
+        Starts a transaction unless one is already open. BEGIN TRANSACTION is
+        sent with the next statement, so that blocks running no queries
+        cost no round trips.
+        """
+        if not self._in_transaction:
+            self._transaction_pending = True
+
+    def _commit(self):
+        BaseDatabaseWrapper._commit(self)
+        self._in_transaction = self._transaction_pending = False
+        if self._written_tables:
+            self.result_cache.invalidate(self._written_tables)
+            self._written_tables.clear()
+
     def _rollback(self):
         try:
             BaseDatabaseWrapper._rollback(self)
         except Database.NotSupportedError:
             pass
+        self._in_transaction = self._transaction_pending = False
+        self._written_tables.clear()
+
+    def commit(self):
+        super(DatabaseWrapper, self).commit()
+        # Statements after a commit in a managed block must stay transactional
+        if self.is_managed():
+            self._begin()
+
+    def rollback(self):
+        super(DatabaseWrapper, self).rollback()
+        if self.is_managed():
+            self._begin()
+
+    def _enter_transaction_management(self, managed):
+        if managed:
+            self._begin()
+
+    def _leave_transaction_management(self, managed):
+        # Called before the state is popped. Django rolls back a dirty
+        # transaction afterwards; a clean one is ended here when the
+        # outermost block is left.
+        if len(self.transaction_state) <= 1 and not self.is_dirty():
+            self._transaction_pending = False
+            if self._in_transaction:
+                self._commit()
+
+    def _savepoint(self, sid):
+        # In autocommit mode every statement is its own transaction, so there
+        # is nothing a savepoint could undo
+        if not self.is_managed():
+            return
+        self._begin()
+        super(DatabaseWrapper, self)._savepoint(sid)
+
+    def _savepoint_rollback(self, sid):
+        if self._in_transaction:
+            super(DatabaseWrapper, self)._savepoint_rollback(sid)
+
+    def _savepoint_commit(self, sid):
+        pass
+
+    def atomic(self):
+        """
+        Returns a context manager and decorator running a block in a
+        transaction, or in a savepoint when nested in another atomic block.
+        """
+        return Atomic(self.alias)
+
+    def task_done(self):
+        """
+        Ends the use of a worker thread's connection by a task, see
+        adsdb_django.parallel.run_task. An idle connection stays open for the
+        thread's next task, saving a login. A pooled connection is given back
+        to the pool, and one left in a transaction is closed.
+        """
+        if (self.pool is None and not self.transaction_state and
+            not self.is_dirty() and not self._in_transaction and
+            not self._transaction_pending):
+            # The task's writes are committed, later reads may use replicas
+            self._primary_pinned = False
+            return
+        self.close()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) in one of the AsyncWorkers threads of this
+        alias and returns a concurrent.futures.Future for its result, e.g.
+        connection.submit(list, queryset). The worker's connections are
+        released with task_done when func returns; see adsdb_django.parallel.
+        """
+        executor = parallel.get_executor(self.alias, self.backend_options['AsyncWorkers'])
+        return executor.submit(parallel.run_task, func, args, kwargs)
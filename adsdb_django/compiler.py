@@ -1,40 +1,70 @@
-import re
-
 from django.db.models.sql import compiler
 
 # Cache classes that have already been built
 _classes = {}
-select_re = re.compile('^SELECT[ ]+(DISTINCT\s)?')
 
 class SQLCompiler(compiler.SQLCompiler):
     def as_sql(self, with_limits=True, with_col_aliases=True):
         query, params = super(SQLCompiler, self).as_sql(with_limits=False, 
                                                         with_col_aliases=with_col_aliases)
-        m = select_re.match(query)
-        if with_limits and m != None:
-            num = None
-            insert = None
-            if self.query.high_mark is not None:
-                num = self.query.high_mark - self.query.low_mark
-                if num <= 0:
-                    return None, None
-                insert = 'TOP %d' % num
-            if self.query.low_mark:
-                if self.query.high_mark is None:
-                    num = self.connection.ops.no_limit_value()
-                    if num:
-                        insert = 'TOP %d' % (1, num)[num > 0]
-                if insert is not None:
-                    insert = '%s START AT %d' % (insert, self.query.low_mark + 1)
+        if not with_limits:
+            return query, params
+        num = None
+        insert = None
+        if self.query.high_mark is not None:
+            num = self.query.high_mark - self.query.low_mark
+            if num <= 0:
+                return None, None
+            insert = 'TOP %d' % num
+        if self.query.low_mark:
+            if self.query.high_mark is None:
+                num = self.connection.ops.no_limit_value()
+                if num:
+                    insert = 'TOP %d' % (1, num)[num > 0]
             if insert is not None:
-                if m.groups()[0] != None:
-                    query = select_re.sub('SELECT DISTINCT %s ' % insert, query)
-                else:
-                    query = select_re.sub('SELECT %s ' % insert, query)
+                insert = '%s START AT %d' % (insert, self.query.low_mark + 1)
+        if insert is not None:
+            # Django's compiler always starts the statement with "SELECT " or
+            # "SELECT DISTINCT ", so the clause is spliced in by position
+            # rather than by searching the statement.
+            if self.query.distinct:
+                prefix = 'SELECT DISTINCT '
+            else:
+                prefix = 'SELECT '
+            if query.startswith(prefix):
+                query = '%s%s %s' % (prefix, insert, query[len(prefix):])
         return query, params
 
 class SQLInsertCompiler(compiler.SQLInsertCompiler, SQLCompiler):
-    pass
+    def execute_bulk(self, rows, batch_size=None, return_ids=False):
+        """
+        Inserts many rows with the statement this query compiles to. Each row
+        is a sequence of parameters in the order of self.query.columns.
+
+        Rows are sent with executemany in batches of batch_size (defaults to
+        the BulkInsertBatchSize option); adsdb still executes them one at a
+        time on the server. If return_ids is True the generated
+        autoinc values are returned instead, which requires executing the
+        rows one at a time and reading LASTAUTOINC(CONNECTION) after each:
+        other connections may take autoinc values in the middle of a batch,
+        even one inside a transaction, so the values of a batch can't be
+        inferred from the last one.
+        """
+        if batch_size is None:
+            batch_size = self.connection.backend_options['BulkInsertBatchSize']
+        opts = self.query.model._meta
+        self.return_id = False
+        sql, params = self.as_sql()
+        cursor = self.connection.cursor()
+        if return_ids:
+            ids = []
+            for row in rows:
+                cursor.execute(sql, row)
+                ids.append(self.connection.ops.last_insert_id(cursor,
+                                opts.db_table, opts.pk.column))
+            return ids
+        for start in xrange(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
 
 class SQLDeleteCompiler(compiler.SQLDeleteCompiler, SQLCompiler):
     pass
@@ -0,0 +1,108 @@
+"""
+Conversion of fetched Advantage values to Python types.
+
+Rather than per-value converters registered globally with adsdb, a
+RowConverter is built once per result shape from cursor.description. It
+converts whole batches of rows column by column and leaves columns that
+need no conversion alone.
+"""
+
+import datetime
+import decimal
+
+from adsdb_django.driver import Database
+
+# Position of the DT_* type code in an adsdb cursor.description entry, see
+# DatabaseIntrospection.get_field_type
+TYPE_CODE = 7
+
+
+def convert_timestamp(value):
+    "Parses 'YYYY-MM-DD HH:MM:SS[.ffffff]' directly, else uses adsdb's parser"
+    if isinstance(value, basestring) and len(value) >= 19 and value[10] == ' ':
+        try:
+            microseconds = 0
+            if len(value) > 20 and value[19] == '.':
+                microseconds = int((value[20:26] + '00000')[:6])
+            return datetime.datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                                     int(value[11:13]), int(value[14:16]), int(value[17:19]),
+                                     microseconds)
+        except ValueError:
+            pass
+    return Database.ads_typecast_timestamp(value)
+
+def convert_date(value):
+    "Parses 'YYYY-MM-DD' directly, else uses adsdb's parser"
+    if isinstance(value, basestring) and len(value) == 10:
+        try:
+            return datetime.date(int(value[0:4]), int(value[5:7]), int(value[8:10]))
+        except ValueError:
+            pass
+    return Database.ads_typecast_date(value)
+
+def convert_decimal(value):
+    if value == '':
+        return None
+    return decimal.Decimal(value)
+
+def column_converters():
+    "Returns the DT_* type code -> converter mapping."
+    return {
+        Database.DT_TIMESTAMP: convert_timestamp,
+        Database.DT_DATE: convert_date,
+        Database.DT_TIME: Database.ads_typecast_time,
+        Database.DT_DECIMAL: convert_decimal,
+        Database.DT_BIT: bool,
+    }
+
+
+class RowConverter(object):
+    """
+    Converts rows of one result shape. columns is a list of
+    (index, converter) pairs for the columns needing conversion.
+    """
+    def __init__(self, columns):
+        self.columns = columns
+
+    def convert(self, rows):
+        "Converts a list of rows, returning a list of tuples."
+        if not self.columns or not rows:
+            return rows
+        columns = zip(*rows)
+        for i, converter in self.columns:
+            columns[i] = [converter(value) if value is not None else None
+                          for value in columns[i]]
+        return zip(*columns)
+
+
+_converters = {}
+_column_converters = None
+
+def get_column_converters():
+    "Returns the DT_* type code -> converter mapping, built once."
+    global _column_converters
+    if _column_converters is None:
+        _column_converters = column_converters()
+    return _column_converters
+
+def get_row_converter(description):
+    """
+    Returns the RowConverter for a cursor.description, or None if no
+    column needs converting.
+    """
+    if not description:
+        return None
+    type_codes = tuple([column[TYPE_CODE] if len(column) > TYPE_CODE else column[1]
+                        for column in description])
+    try:
+        return _converters[type_codes]
+    except KeyError:
+        pass
+    converters = get_column_converters()
+    columns = [(i, converters[code]) for i, code in enumerate(type_codes)
+               if code in converters]
+    converter = None
+    if columns:
+        converter = RowConverter(columns)
+    _converters[type_codes] = converter
+    return converter
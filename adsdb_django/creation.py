@@ -1,13 +1,24 @@
 import sys, traceback, time, re
 import os
+import shutil
 from django.conf import settings
+from django.utils.hashcompat import md5_constructor
 from django.db.backends.creation import BaseDatabaseCreation, TEST_DATABASE_PREFIX
-
-try:
-    import adsdb as Database
-except ImportError, e:
-    from django.core.exceptions import ImproperlyConfigured
-    raise ImproperlyConfigured("Error loading adsdb module: %s" % e)
+from django.db.backends.util import truncate_name
+
+# Files making up an Advantage data dictionary and its tables
+ads_file_extensions = ('.adt', '.adm', '.adi', '.add', '.ai', '.am')
+
+# Settings of a field in the FullTextIndexes option and the clauses of the
+# Advantage full text index they turn into
+fulltext_index_options = (
+    ('MinWord', 'MIN WORD %d'),
+    ('MaxWord', 'MAX WORD %d'),
+    ('Delimiters', 'DELIMITERS %s'),
+    ('Noise', 'NOISE %s'),
+    ('DropChars', 'DROPCHARS %s'),
+    ('Conditionals', 'CONDITIONALS %s'),
+)
 
 class DatabaseCreation(BaseDatabaseCreation):
     # This dictionary maps Field objects to their associated Advantage column
@@ -76,28 +87,114 @@ class DatabaseCreation(BaseDatabaseCreation):
         "ADSDB doesn't support constraints"
         return []
 
-    def _create_test_db(self, verbosity, autoclobber):
-        "Internal implementation - creates the test db tables."
-
+    def _get_test_db_name(self):
+        "The test data dictionary is created in the directory given as NAME"
         test_database_name = self.connection.settings_dict['TEST_NAME']
         if test_database_name == None :
             test_database_name = 'test_ads.add'
+        return os.path.join(self.connection.settings_dict['NAME'], test_database_name)
+
+    def _remove_database_files(self, path):
+        for file in os.listdir( path ):
+            if os.path.splitext( file )[1].lower() in ads_file_extensions:
+                os.remove( os.path.join( path, file ) )
+
+    def _copy_database_files(self, source, destination):
+        for file in os.listdir( source ):
+            if os.path.splitext( file )[1].lower() in ads_file_extensions:
+                shutil.copy2( os.path.join( source, file ), destination )
+
+    def _initial_data_files(self):
+        """
+        Returns the paths of the initial_data fixtures, looked up like
+        loaddata does, which flush loads into a new test database.
+        """
+        from django.db import models
+        fixture_dirs = []
+        for app in models.get_apps():
+            # A models.py module or a models/ package
+            for path in getattr(app, '__path__', [app.__file__]):
+                fixture_dirs.append(os.path.join(os.path.dirname(path), 'fixtures'))
+        fixture_dirs.extend(list(settings.FIXTURE_DIRS) + [''])
+        files = []
+        for fixture_dir in fixture_dirs:
+            try:
+                names = sorted(os.listdir(fixture_dir or os.curdir))
+            except OSError:
+                continue
+            files.extend([os.path.join(fixture_dir, name) for name in names
+                          if name.startswith('initial_data.')])
+        return files
+
+    def _schema_digest(self):
+        """
+        Returns a digest of the SQL creating the tables and indexes of all
+        installed models, their custom SQL, the initial_data fixtures and the
+        FlushMode option, identifying the test database template to use.
+        """
+        from django.db import models
+        from django.core.management.color import no_style
+        from django.core.management.sql import custom_sql_for_model
+        style = no_style()
+        statements = [self.connection.settings_dict['NAME'],
+                      self.connection.ops.flush_mode]
+        for app in models.get_apps():
+            for model in models.get_models(app, include_auto_created=True):
+                statements.extend(self.sql_create_model(model, style)[0])
+                statements.extend(self.sql_indexes_for_model(model, style))
+                statements.extend(custom_sql_for_model(model, style, self.connection))
+        digest = md5_constructor('\n'.join(statements).encode('utf-8'))
+        for path in self._initial_data_files():
+            digest.update('\n%s\n' % path)
+            fixture = open(path, 'rb')
+            try:
+                digest.update(fixture.read())
+            finally:
+                fixture.close()
+        return digest.hexdigest()
+
+    def _close_connections(self):
+        "Closes the connection, including pooled ones, so the files can be copied"
+        self.connection.close()
+        if self.connection.pool is not None:
+            self.connection.pool.close()
+
+    def create_test_db(self, verbosity=1, autoclobber=False):
+        """
+        With the TestDatabaseTemplate option the files of a freshly built test
+        database are kept as a template for the current schema. Later runs
+        copy the template files instead of creating the database and running
+        syncdb again.
+        """
+        if not self.connection.backend_options['TestDatabaseTemplate']:
+            return super(DatabaseCreation, self).create_test_db(verbosity, autoclobber)
+
+        test_database_name = self._get_test_db_name()
+        test_database_path = os.path.dirname(test_database_name)
+        template_path = os.path.join(test_database_path,
+                                     'template_%s' % self._schema_digest())
+
+        if not os.path.isdir(template_path):
+            super(DatabaseCreation, self).create_test_db(verbosity, autoclobber)
+            self._close_connections()
+            os.mkdir(template_path)
+            self._copy_database_files(test_database_path, template_path)
+            return test_database_name
+
+        if verbosity >= 1:
+            print "Cloning test database for alias '%s' from template..." % self.connection.alias
+        self._close_connections()
+        self._remove_database_files(test_database_path)
+        self._copy_database_files(template_path, test_database_path)
+        self.connection.settings_dict["NAME"] = test_database_name
+        self.connection.features.confirm()
+        return test_database_name
+
+    def _create_test_db(self, verbosity, autoclobber):
+        "Internal implementation - creates the test db tables."
 
-        test_database_path = self.connection.settings_dict['NAME']
-
-        for file in os.listdir( test_database_path ):
-            if file.endswith( 'adt' ):
-                os.remove( file )
-            elif file.endswith( 'adm' ):
-                os.remove( file )
-            elif file.endswith( 'adi' ):
-                os.remove( file )
-            elif file.endswith( 'add' ):
-                os.remove( file )
-            elif file.endswith( 'ai' ):
-                os.remove( file )
-            elif file.endswith( 'am' ):
-                os.remove( file )
+        test_database_name = self._get_test_db_name()
+        self._remove_database_files(os.path.dirname(test_database_name))
 
         cursor = self.connection.cursor()
 
@@ -109,8 +206,6 @@ class DatabaseCreation(BaseDatabaseCreation):
             sys.exit(2)
 
         cursor.close()
-        test_database_path = self.connection.settings_dict['NAME']
-        self.connection.settings_dict['NAME'] = '%s/%s' % (test_database_path, test_database_name)
         return test_database_name
 
     def _destroy_test_db(self, test_database_name, verbosity):
@@ -119,18 +214,8 @@ class DatabaseCreation(BaseDatabaseCreation):
 
 
     def _rollback_works(self):
-        "Test to determine if rollbacks work" # needed by the django test suite
-        cursor = self.connection.cursor()
-        cursor.execute('CREATE TABLE ROLLBACK_TEST (X INTEGER)')
-        self.connection._commit()
-        cursor.execute('BEGIN TRANSACTION')
-        cursor.execute('INSERT INTO ROLLBACK_TEST (X) VALUES (8)')
-        self.connection._rollback()
-        cursor.execute('SELECT COUNT(X) FROM ROLLBACK_TEST')
-        count, = cursor.fetchone()
-        cursor.execute('DROP TABLE ROLLBACK_TEST')
-        self.connection._commit()
-        return count == 0
+        "Advantage tables take part in transactions" # needed by the django test suite
+        return True
 
     def _unique_swap(self, query, fields, model, style, table=None):
         """
@@ -205,6 +290,111 @@ class DatabaseCreation(BaseDatabaseCreation):
 
         return outputs, pending
 
+    def fulltext_fields(self, model):
+        """
+        Returns (field, options) pairs for the fields of the model listed in
+        the FullTextIndexes option, which maps 'app_label.ModelName' to a
+        list of field names or a dictionary of field name -> index options.
+        """
+        config = self.connection.backend_options['FullTextIndexes'] or {}
+        fields = config.get('%s.%s' % (model._meta.app_label, model._meta.object_name), ())
+        if isinstance(fields, (list, tuple)):
+            fields = dict([(name, {}) for name in fields])
+        return [(model._meta.get_field(name), options) for name, options in fields.items()]
+
+    def fulltext_index_name(self, model, f):
+        return truncate_name('%s_%s_fts' % (model._meta.db_table, f.column),
+                             self.connection.ops.max_name_length())
+
+    def sql_fulltext_indexes_for_model(self, model, style):
+        "Returns the CREATE INDEX statements of the model's full text indexes"
+        qn = self.connection.ops.quote_name
+        output = []
+        for f, options in self.fulltext_fields(model):
+            clauses = ['CONTENT']
+            for name, clause in fulltext_index_options:
+                if name in options:
+                    value = options[name]
+                    if isinstance(value, basestring):
+                        # CursorWrapper.execute %-formats every statement
+                        value = "'%s'" % value.replace("'", "''").replace('%', '%%')
+                    clauses.append(clause % value)
+            output.append('%s %s %s %s (%s) %s;' % (
+                style.SQL_KEYWORD('CREATE INDEX'),
+                style.SQL_TABLE(qn(self.fulltext_index_name(model, f))),
+                style.SQL_KEYWORD('ON'),
+                style.SQL_TABLE(qn(model._meta.db_table)),
+                style.SQL_FIELD(qn(f.column)),
+                style.SQL_KEYWORD(' '.join(clauses))))
+        return output
+
+    def sql_destroy_fulltext_indexes_for_model(self, model, style):
+        "Returns the DROP INDEX statements of the model's full text indexes"
+        qn = self.connection.ops.quote_name
+        return ['%s %s.%s;' % (style.SQL_KEYWORD('DROP INDEX'),
+                               style.SQL_TABLE(qn(model._meta.db_table)),
+                               style.SQL_TABLE(qn(self.fulltext_index_name(model, f))))
+                for f, options in self.fulltext_fields(model)]
+
+    def case_insensitive_fields(self, model):
+        "Returns the fields of the model listed in the CaseInsensitiveIndexes option"
+        config = self.connection.backend_options['CaseInsensitiveIndexes'] or {}
+        names = config.get('%s.%s' % (model._meta.app_label, model._meta.object_name), ())
+        return [model._meta.get_field(name) for name in names]
+
+    def case_insensitive_index_name(self, model, f):
+        return truncate_name('%s_%s_ci' % (model._meta.db_table, f.column),
+                             self.connection.ops.max_name_length())
+
+    def sql_case_insensitive_indexes_for_model(self, model, style):
+        """
+        Returns the statements creating UPPER(col) indexes for the fields of
+        the model listed in the CaseInsensitiveIndexes option, which maps
+        'app_label.ModelName' to a list of field names. These are used by
+        lookups compiled with the CaseInsensitiveLookups option.
+        """
+        sq = self.connection.ops.squote_name
+        output = []
+        for f in self.case_insensitive_fields(model):
+            i_name = self.case_insensitive_index_name(model, f)
+            # CREATE INDEX only takes columns, expression indexes need the
+            # system procedure. 2 is ADS_COMPOUND, i.e. the table's .adi file
+            output.append("%s sp_CreateIndex90( %s, NULL, %s, %s, '', 2, 512, '' );" % (
+                style.SQL_KEYWORD('EXECUTE PROCEDURE'),
+                style.SQL_TABLE(sq(model._meta.db_table)),
+                style.SQL_TABLE(sq(i_name)),
+                style.SQL_FIELD(sq('UPPER(%s)' % f.column))))
+        return output
+
+    def sql_indexes_for_model(self, model, style):
+        "Adds the full text and UPPER(col) indexes to the indexes Django creates"
+        output = super(DatabaseCreation, self).sql_indexes_for_model(model, style)
+        if model._meta.managed and not model._meta.proxy:
+            output.extend(self.sql_fulltext_indexes_for_model(model, style))
+            output.extend(self.sql_case_insensitive_indexes_for_model(model, style))
+        return output
+
+    def sql_destroy_indexes_for_model(self, model, style):
+        """
+        Returns the DROP INDEX statements for the indexes sql_indexes_for_model
+        creates, e.g. to drop them during a bulk load and create them again
+        afterwards. Unique indexes are left alone.
+        """
+        if not model._meta.managed or model._meta.proxy:
+            return []
+        qn = self.connection.ops.quote_name
+        names = [truncate_name('%s_%s' % (model._meta.db_table, self._digest(f.column)),
+                               self.connection.ops.max_name_length())
+                 for f in model._meta.local_fields if f.db_index and not f.unique]
+        names.extend([self.case_insensitive_index_name(model, f)
+                      for f in self.case_insensitive_fields(model)])
+        output = ['%s %s.%s;' % (style.SQL_KEYWORD('DROP INDEX'),
+                                 style.SQL_TABLE(qn(model._meta.db_table)),
+                                 style.SQL_TABLE(qn(name)))
+                  for name in names]
+        output.extend(self.sql_destroy_fulltext_indexes_for_model(model, style))
+        return output
+
     def sql_for_many_to_many_field(self, model, f, style):
         "ADS doesn't support relations with django"
         return []
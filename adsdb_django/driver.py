@@ -0,0 +1,78 @@
+"""
+Deferred loading of the adsdb module.
+
+Importing adsdb loads the Advantage client library, which processes that
+never query the database (most management commands, or workers forked
+before the first request) should not pay for. The backend modules refer to
+the driver through Database, which imports adsdb on first attribute access,
+normally when the first connection is opened.
+"""
+
+import threading
+
+
+class LazyDriver(object):
+    "Stands in for the adsdb module, importing it when first used."
+    def __init__(self):
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        "Returns the adsdb module, importing it if needed."
+        if self._module is None:
+            self._lock.acquire()
+            try:
+                if self._module is None:
+                    try:
+                        import adsdb
+                    except ImportError, e:
+                        from django.core.exceptions import ImproperlyConfigured
+                        raise ImproperlyConfigured("Error loading adsdb module: %s" % e)
+                    self._module = adsdb
+            finally:
+                self._lock.release()
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+Database = LazyDriver()
+
+
+class LazyTypeMap(object):
+    """
+    A read only mapping keyed by adsdb DT_* type codes, given by constant
+    name, e.g. LazyTypeMap({'DT_DATE': 'DateField'}). The codes are looked up
+    when the mapping is first used.
+    """
+    def __init__(self, names):
+        self.names = names
+        self._map = None
+
+    def _get_map(self):
+        if self._map is None:
+            self._map = dict([(getattr(Database, name), value)
+                              for name, value in self.names.items()])
+        return self._map
+
+    def __getitem__(self, code):
+        return self._get_map()[code]
+
+    def __contains__(self, code):
+        return code in self._get_map()
+
+    def __iter__(self):
+        return iter(self._get_map())
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, code, default=None):
+        return self._get_map().get(code, default)
+
+    def items(self):
+        return self._get_map().items()
@@ -0,0 +1,319 @@
+"""
+Advantage specific operations on models and querysets which the Django
+ORM has no API for.
+"""
+
+import datetime
+
+from django.db import connections, router, transaction
+from django.db.models import AutoField, Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.sql import InsertQuery, DeleteQuery
+from django.db.models.sql.datastructures import EmptyResultSet
+
+from adsdb_django.util import Column
+
+
+def bulk_insert(objs, batch_size=None, using=None):
+    """
+    Inserts a list of unsaved model instances of the same model in batches
+    using one transaction, and sets their primary keys afterwards.
+
+    This saves the overhead of Model.save() per object, not round trips:
+    adsdb's executemany makes one per row. Generated keys can only be read
+    back one row at a time, so when the model has an autoinc key and no
+    instance has a key set the rows are inserted one by one, each followed
+    by a LASTAUTOINC query, which is no faster than saving them one by one
+    in a transaction.
+
+    Unlike Model.save() no signals are sent and parent models of
+    multi-table inheritance are not saved.
+    """
+    objs = list(objs)
+    if not objs:
+        return objs
+    model = objs[0].__class__
+    opts = model._meta
+    if using is None:
+        using = router.db_for_write(model, instance=objs[0])
+    connection = connections[using]
+
+    # Generated keys are only fetched when no instance has a primary key,
+    # otherwise the given keys are inserted as they are.
+    return_ids = opts.has_auto_field and \
+        not [obj for obj in objs if obj.pk is not None]
+    fields = [f for f in opts.local_fields
+              if not (return_ids and isinstance(f, AutoField))]
+    rows = [tuple([f.get_db_prep_save(f.pre_save(obj, True), connection=connection)
+                   for f in fields])
+            for obj in objs]
+
+    query = InsertQuery(model)
+    query.insert_values([(f, None) for f in fields])
+    compiler = query.get_compiler(using=using)
+
+    def insert():
+        return compiler.execute_bulk(rows, batch_size, return_ids=return_ids)
+    ids = transaction.commit_on_success(using=using)(insert)()
+
+    for i, obj in enumerate(objs):
+        if return_ids:
+            setattr(obj, opts.pk.attname, ids[i])
+        obj._state.db = using
+        obj._state.adding = False
+    return objs
+
+
+def _run_chunked(queryset, execute, batch_size, commit, progress):
+    """
+    Calls execute(queryset) for consecutive primary key ranges of the
+    queryset holding batch_size matching rows each, and returns the total of
+    the row counts it returns. See chunked_update.
+    """
+    if queryset.query.low_mark or queryset.query.high_mark is not None:
+        raise TypeError("Cannot run a chunked statement once a slice has been taken.")
+    using = queryset.db
+    if batch_size is None:
+        batch_size = connections[using].backend_options['ChunkedBatchSize']
+    queryset = queryset.order_by()
+
+    def run_batch(batch):
+        return execute(batch)
+    if commit:
+        run_batch = transaction.commit_on_success(using=using)(run_batch)
+
+    def run():
+        rows = batches = 0
+        last = None
+        while True:
+            remaining = queryset
+            if last is not None:
+                remaining = remaining.filter(pk__gt=last)
+            # The primary key of the batch_size-th row left is the upper bound
+            # of the next batch, found with TOP 1 START AT batch_size
+            bound = list(remaining.order_by('pk').values_list('pk', flat=True)
+                         [batch_size - 1:batch_size])
+            if bound:
+                rows += run_batch(remaining.filter(pk__lte=bound[0]))
+            else:
+                rows += run_batch(remaining)
+            batches += 1
+            if progress is not None:
+                progress(rows, batches)
+            if not bound:
+                return rows
+            last = bound[0]
+    if not commit:
+        run = transaction.commit_on_success(using=using)(run)
+    return run()
+
+def chunked_update(queryset, values, batch_size=None, commit=False, progress=None):
+    """
+    Runs queryset.update(**values) as a series of statements, each limited to
+    a primary key range of batch_size matching rows (defaults to the
+    ChunkedBatchSize option), and returns the number of rows updated.
+
+    With commit=True each statement is committed on its own, so locks are
+    held and the transaction log grows for one batch only; otherwise all of
+    them run in one transaction. progress, if given, is called with the rows
+    done and the number of batches after every statement.
+    """
+    return _run_chunked(queryset, lambda batch: batch.update(**values),
+                        batch_size, commit, progress)
+
+def _delete_rows(queryset):
+    "Deletes the rows of a queryset with one DELETE, returning the row count."
+    query = queryset.query
+    if len(query.tables) > 1:
+        # The filters join other tables, which DELETE can't, and Advantage
+        # can't select from the table being changed in a subquery either,
+        # so the primary keys are fetched first like
+        # SQLUpdateCompiler.pre_sql_setup does.
+        pks = list(queryset.values_list('pk', flat=True))
+        if not pks:
+            return 0
+        query = queryset.model._base_manager.using(queryset.db).filter(
+            pk__in=pks).query
+    query = query.clone(klass=DeleteQuery)
+    cursor = query.get_compiler(using=queryset.db).execute_sql(None)
+    return cursor.rowcount
+
+def chunked_delete(queryset, batch_size=None, commit=False, progress=None):
+    """
+    Deletes the rows of a queryset in primary key ranges like chunked_update,
+    and returns the number of rows deleted.
+
+    Unlike QuerySet.delete() the rows are deleted with DELETE statements
+    only: no signals are sent and related objects are not collected, so
+    rows referring to the deleted ones must be dealt with first.
+    """
+    return _run_chunked(queryset, _delete_rows, batch_size, commit, progress)
+
+def _keyset_ordering(queryset):
+    """
+    Returns the (field name, descending) pairs a queryset is ordered by, with
+    the primary key appended so that the ordering is unique.
+    """
+    query = queryset.query
+    opts = query.model._meta
+    ordering = query.order_by or (query.default_ordering and opts.ordering) or []
+    keys = []
+    for name in ordering:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        if '__' in name or '.' in name or name == '?':
+            raise ValueError("Keyset pagination only supports ordering by "
+                             "fields of the model itself, not %r" % name)
+        try:
+            field = opts.get_field(name)
+        except FieldDoesNotExist:
+            field = None
+        # Ordering by a relation sorts by the related model's ordering,
+        # which the key of the last row doesn't hold
+        if field is not None and field.rel is not None:
+            raise ValueError("Keyset pagination can't order by the relation "
+                             "%r, order by fields of the model itself" % name)
+        if name == opts.pk.name:
+            name = 'pk'
+        keys.append((name, descending))
+    if 'pk' not in [name for name, descending in keys]:
+        keys.append(('pk', False))
+    return keys
+
+def _keyset_equal(name, value):
+    if value is None:
+        return Q(**{str('%s__isnull' % name): True})
+    return Q(**{str(name): value})
+
+def _keyset_after(name, descending, value):
+    """
+    Returns a Q for the rows following value in a column, or None if no row
+    can. Advantage sorts NULL before all other values, so NULLs come first
+    in ascending and last in descending order.
+    """
+    if not descending:
+        if value is None:
+            return Q(**{str('%s__isnull' % name): False})
+        return Q(**{str('%s__gt' % name): value})
+    if value is None:
+        return None
+    return Q(**{str('%s__lt' % name): value}) | Q(**{str('%s__isnull' % name): True})
+
+def keyset_page(queryset, size, after=None):
+    """
+    Returns (objects, next_key) for one page of the queryset.
+
+    Instead of slicing with an offset, which makes the server read and skip
+    all earlier rows, the page starts after the row whose ordering values are
+    given in after, so the lookup can use an index on the ordering columns.
+    Pass next_key as after to get the following page; it is None on the last
+    page. The queryset must be ordered by fields of its own model other than
+    foreign keys, the primary key is added to the ordering to make it
+    unique. Ordering columns may contain NULLs.
+    """
+    keys = _keyset_ordering(queryset)
+    queryset = queryset.order_by(*[(descending and '-' or '') + name
+                                   for name, descending in keys])
+    if after is not None:
+        # (a, b) > (x, y) written as a > x OR (a = x AND b > y)
+        condition = None
+        for i, (name, descending) in enumerate(keys):
+            term = _keyset_after(name, descending, after[i])
+            if term is None:
+                continue
+            for j in range(i):
+                term &= _keyset_equal(keys[j][0], after[j])
+            if condition is None:
+                condition = term
+            else:
+                condition |= term
+        queryset = queryset.filter(condition)
+
+    objects = list(queryset[:size])
+    next_key = None
+    if len(objects) == size:
+        last = objects[-1]
+        next_key = tuple([getattr(last, name) for name, descending in keys])
+    return objects, next_key
+
+def keyset_iterator(queryset, size=1000):
+    "Iterates over a large queryset in keyset paginated chunks of size rows."
+    after = None
+    while True:
+        objects, after = keyset_page(queryset, size, after)
+        for obj in objects:
+            yield obj
+        if after is None:
+            break
+
+def values_columns(queryset, *fields, **kwargs):
+    """
+    Evaluates queryset.values_list(*fields) and returns the result as a list
+    of Column objects, one per field, instead of a tuple per row. See
+    CursorWrapper.fetch_columns; use_numpy may be passed as a keyword.
+    """
+    queryset = queryset.values_list(*fields)
+    connection = connections[queryset.db]
+    try:
+        sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+    except EmptyResultSet:
+        return [Column(field) for field in fields]
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    columns = cursor.fetch_columns(use_numpy=kwargs.get('use_numpy'))
+    for field, column in zip(fields, columns):
+        column.name = field
+    return columns
+
+def date_range(field_name, year, month=None, day=None):
+    """
+    Returns a Q object matching the given year, month of a year or day as a
+    half-open range on field_name, e.g. created >= 2025-03-01 AND
+    created < 2025-04-01. Unlike __month and __day lookups, which wrap the
+    column in MONTH() or DAYOFMONTH(), this lets Advantage use an index on
+    the column.
+    """
+    if month is None:
+        start = datetime.date(year, 1, 1)
+        end = datetime.date(year + 1, 1, 1)
+    elif day is None:
+        start = datetime.date(year, month, 1)
+        end = datetime.date(year + month // 12, month % 12 + 1, 1)
+    else:
+        start = datetime.date(year, month, day)
+        end = start + datetime.timedelta(days=1)
+    return Q(**{str('%s__gte' % field_name): start, str('%s__lt' % field_name): end})
+
+def create_fulltext_indexes(model, using=None, rebuild=False):
+    """
+    Creates the full text indexes configured in the FullTextIndexes option
+    for a model whose table already exists. With rebuild=True existing
+    indexes are dropped first, e.g. to apply changed index options.
+    """
+    from django.core.management.color import no_style
+    if using is None:
+        using = router.db_for_write(model)
+    connection = connections[using]
+    statements = []
+    if rebuild:
+        statements.extend(connection.creation.sql_destroy_fulltext_indexes_for_model(model, no_style()))
+    statements.extend(connection.creation.sql_fulltext_indexes_for_model(model, no_style()))
+    cursor = connection.cursor()
+    for statement in statements:
+        cursor.execute(statement)
+    transaction.commit_unless_managed(using=using)
+
+def ranked_search(queryset, field_name, terms, rank_name='rank'):
+    """
+    Filters the queryset with a full text CONTAINS search on field_name and
+    orders it by the SCORE of each match, best first. The score is available
+    on the results as rank_name.
+    """
+    opts = queryset.model._meta
+    qn = connections[queryset.db].ops.quote_name
+    column = '%s.%s' % (qn(opts.db_table), qn(opts.get_field(field_name).column))
+    return queryset.extra(select={rank_name: 'SCORE(%s, %%s)' % column},
+                          select_params=[terms],
+                          where=['CONTAINS(%s, %%s)' % column],
+                          params=[terms],
+                          order_by=['-%s' % rank_name])
@@ -0,0 +1,263 @@
+"""
+In-process statistics and slow query log for the statements run through
+CursorWrapper.
+
+Statements are grouped by fingerprint, the converted SQL with numeric
+literals replaced and IN lists collapsed, so that e.g. every page of a
+sliced queryset counts as the same statement whatever the number of values
+of its filters. At most MAX_STATEMENTS fingerprints are kept; statements
+seen after that are counted together under OTHER_STATEMENTS. Enabled with
+the Instrumentation option; the statistics of a connection alias are shared
+by all its threads.
+"""
+
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import deque
+
+from django.utils import simplejson
+
+from adsdb_django.util import LRUCache
+
+number_re = re.compile(r'\b\d+\b')
+# An IN list of placeholders or numbers, once numbers are replaced
+in_list_re = re.compile(r'\bIN\s*\(\s*[?N](?:\s*,\s*[?N])*\s*\)', re.I)
+
+# Number of fingerprints kept, and the one all further statements count under
+MAX_STATEMENTS = 1000
+OTHER_STATEMENTS = '(other statements)'
+
+logger = logging.getLogger('adsdb_django.slow_queries')
+
+# Upper bounds, in seconds, of the duration histogram buckets. The last
+# bucket counts everything slower.
+HISTOGRAM_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+                    1.0, 2.0, 5.0, 10.0)
+
+
+class StatementStats(object):
+    "Counters for one statement fingerprint."
+    def __init__(self):
+        self.executions = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def as_dict(self):
+        return {'executions': self.executions,
+                'time': self.time,
+                'max_time': self.max_time,
+                'rows': self.rows,
+                'bytes': self.bytes,
+                'histogram': list(self.histogram)}
+
+
+class QueryStats(object):
+    """
+    Collects execution time, rows fetched and (optionally) bytes fetched per
+    statement fingerprint, and calls the registered callbacks with
+    (sql, params, duration) after every execution.
+    """
+    def __init__(self, count_bytes=False, max_statements=MAX_STATEMENTS):
+        self.count_bytes = count_bytes
+        self.max_statements = max_statements
+        self.callbacks = []
+        self.statements = {}
+        self._fingerprints = LRUCache(1024)
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self.callbacks.remove(callback)
+
+    def _statement(self, sql):
+        "Returns the counters for the statement. The lock must be held."
+        fingerprint = self._fingerprints.get(sql)
+        if fingerprint is None:
+            fingerprint = in_list_re.sub('IN (...)', number_re.sub('N', sql))
+            self._fingerprints.set(sql, fingerprint)
+        stats = self.statements.get(fingerprint)
+        if stats is None:
+            if len(self.statements) >= self.max_statements:
+                fingerprint = OTHER_STATEMENTS
+                stats = self.statements.get(fingerprint)
+            if stats is None:
+                stats = self.statements[fingerprint] = StatementStats()
+        return stats
+
+    def record_execute(self, sql, params, duration):
+        self._lock.acquire()
+        try:
+            stats = self._statement(sql)
+            stats.executions += 1
+            stats.time += duration
+            if duration > stats.max_time:
+                stats.max_time = duration
+            stats.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS, duration)] += 1
+        finally:
+            self._lock.release()
+        for callback in self.callbacks:
+            callback(sql, params, duration)
+
+    def record_fetch(self, sql, rows):
+        if not rows:
+            return
+        nbytes = 0
+        if self.count_bytes:
+            for row in rows:
+                for value in row:
+                    if isinstance(value, basestring):
+                        nbytes += len(value)
+        self._lock.acquire()
+        try:
+            stats = self._statement(sql)
+            stats.rows += len(rows)
+            stats.bytes += nbytes
+        finally:
+            self._lock.release()
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            self.statements = {}
+        finally:
+            self._lock.release()
+
+    def snapshot(self):
+        """
+        Returns the statistics as a dictionary of fingerprint -> counters,
+        along with the histogram bucket bounds.
+        """
+        self._lock.acquire()
+        try:
+            statements = dict([(fingerprint, stats.as_dict())
+                               for fingerprint, stats in self.statements.items()])
+        finally:
+            self._lock.release()
+        return {'histogram_bounds': list(HISTOGRAM_BOUNDS),
+                'statements': statements}
+
+    def dump(self, fp):
+        "Writes a JSON snapshot of the statistics to the file object fp."
+        simplejson.dump(self.snapshot(), fp, indent=1)
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def get_stats(alias, count_bytes=False):
+    "Returns the QueryStats shared by the connections of the given alias."
+    _stats_lock.acquire()
+    try:
+        stats = _stats.get(alias)
+        if stats is None:
+            stats = _stats[alias] = QueryStats(count_bytes)
+        return stats
+    finally:
+        _stats_lock.release()
+
+
+class SlowQueryLog(object):
+    """
+    Keeps the most recent statements slower than threshold seconds, with the
+    shapes of their parameters and the code location that ran them, and logs
+    them to the 'adsdb_django.slow_queries' logger.
+
+    For statements slower than plan_threshold the plan_sql template (with a
+    %s for the quoted statement) is run to store the execution plan too. At
+    most rate entries are recorded per second; the rest are only counted.
+    """
+    def __init__(self, threshold, plan_threshold=None, plan_sql=None,
+                 rate=10, size=100):
+        self.threshold = threshold
+        self.plan_threshold = plan_threshold
+        self.plan_sql = plan_sql
+        self.rate = rate
+        self.entries = deque(maxlen=size)
+        self.dropped = 0
+        self._allowance = rate
+        self._last = time.time()
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        "Token bucket refilled at rate entries per second. Lock must be held."
+        now = time.time()
+        self._allowance = min(self.rate, self._allowance + (now - self._last) * self.rate)
+        self._last = now
+        if self._allowance < 1:
+            self.dropped += 1
+            return False
+        self._allowance -= 1
+        return True
+
+    def record(self, connection, sql, params, duration):
+        self._lock.acquire()
+        try:
+            if not self._admit():
+                return
+        finally:
+            self._lock.release()
+
+        entry = {'sql': sql,
+                 'params': [type(param).__name__ for param in params or ()],
+                 'duration': duration,
+                 'location': caller_location(),
+                 'time': time.time(),
+                 'plan': None}
+        if (self.plan_sql and self.plan_threshold is not None and
+            duration >= self.plan_threshold and connection is not None):
+            entry['plan'] = self.explain(connection, sql)
+        self._lock.acquire()
+        try:
+            self.entries.append(entry)
+        finally:
+            self._lock.release()
+        logger.warning("Slow query (%.3fs) at %s: %s", duration,
+                       entry['location'], sql)
+
+    def explain(self, connection, sql):
+        """
+        Returns the rows the plan statement returns for sql, run on a separate
+        cursor so the caller's result set is left alone.
+        """
+        cursor = connection.cursor()
+        try:
+            try:
+                cursor.execute(self.plan_sql % ("'%s'" % sql.replace("'", "''")))
+                return cursor.fetchall()
+            except Exception, e:
+                return 'Could not get the execution plan: %s' % e
+        finally:
+            cursor.close()
+
+
+def caller_location():
+    "Returns 'file:line in function' of the innermost frame outside Django."
+    for filename, lineno, function, text in reversed(traceback.extract_stack()):
+        if not (os.sep + 'django' + os.sep in filename or
+                os.sep + 'adsdb_django' + os.sep in filename):
+            return '%s:%d in %s' % (filename, lineno, function)
+    return None
+
+
+_slow_logs = {}
+
+def get_slow_log(alias, threshold, **options):
+    "Returns the SlowQueryLog shared by the connections of the given alias."
+    _stats_lock.acquire()
+    try:
+        log = _slow_logs.get(alias)
+        if log is None:
+            log = _slow_logs[alias] = SlowQueryLog(threshold, **options)
+        return log
+    finally:
+        _stats_lock.release()
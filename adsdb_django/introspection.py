@@ -1,47 +1,124 @@
 from django.db.backends import BaseDatabaseIntrospection
-from adsdb import ProgrammingError, OperationalError
+from adsdb_django.driver import LazyTypeMap
 import re
-import adsdb
+import threading
+import time
 
 
 foreign_key_re = re.compile(r"\sCONSTRAINT `[^`]*` FOREIGN KEY \(`([^`]*)`\) REFERENCES `([^`]*)` \(`([^`]*)`\)")
 
+# Table metadata shared by all connections of the process, keyed by data
+# source, as (expiry time, metadata). Entries are dropped whenever DDL runs
+# through the backend, and expire after IntrospectionCacheTTL seconds so that
+# DDL run by other processes is seen as well.
+_metadata = {}
+_metadata_lock = threading.Lock()
+
 class DatabaseIntrospection(BaseDatabaseIntrospection):
-    data_types_reverse = { adsdb.DT_DATE         : 'DateField',
-                           adsdb.DT_TIME         : 'TimeField',
-                           adsdb.DT_TIMESTAMP    : 'DateTimeField',
-                           adsdb.DT_VARCHAR      : 'CharField',
-                           adsdb.DT_FIXCHAR      : 'CharField',
-                           adsdb.DT_LONGVARCHAR  : 'TextField',
-                           adsdb.DT_STRING       : 'CharField',
-                           adsdb.DT_DOUBLE       : 'FloatField',
-                           adsdb.DT_FLOAT        : 'FloatField',
-                           adsdb.DT_DECIMAL      : 'DecimalField',
-                           adsdb.DT_INT          : 'IntegerField',
-                           adsdb.DT_SMALLINT     : 'IntegerField',
-                           adsdb.DT_BINARY       : 'BlobField',
-                           adsdb.DT_LONGBINARY   : 'BlobField',
-                           adsdb.DT_TINYINT      : 'IntegerField',
-                           adsdb.DT_BIGINT       : 'BigIntegerField',
-                           adsdb.DT_UNSINT       : 'IntegerField',
-                           adsdb.DT_UNSSMALLINT  : 'IntegerField',
-                           adsdb.DT_UNSBIGINT    : 'BigIntegerField',
-                           adsdb.DT_BIT          : 'NullBooleanField',
-                           adsdb.DT_LONGNVARCHAR : 'TextField',
-                           adsdb.DT_NSTRING      : 'CharField',
-                           adsdb.DT_NFIXCHAR     : 'CharField',
-                           adsdb.DT_NVARCHAR     : 'CharField',
-                         }
+    data_types_reverse = LazyTypeMap({
+        'DT_DATE'         : 'DateField',
+        'DT_TIME'         : 'TimeField',
+        'DT_TIMESTAMP'    : 'DateTimeField',
+        'DT_VARCHAR'      : 'CharField',
+        'DT_FIXCHAR'      : 'CharField',
+        'DT_LONGVARCHAR'  : 'TextField',
+        'DT_STRING'       : 'CharField',
+        'DT_DOUBLE'       : 'FloatField',
+        'DT_FLOAT'        : 'FloatField',
+        'DT_DECIMAL'      : 'DecimalField',
+        'DT_INT'          : 'IntegerField',
+        'DT_SMALLINT'     : 'IntegerField',
+        'DT_BINARY'       : 'BlobField',
+        'DT_LONGBINARY'   : 'BlobField',
+        'DT_TINYINT'      : 'IntegerField',
+        'DT_BIGINT'       : 'BigIntegerField',
+        'DT_UNSINT'       : 'IntegerField',
+        'DT_UNSSMALLINT'  : 'IntegerField',
+        'DT_UNSBIGINT'    : 'BigIntegerField',
+        'DT_BIT'          : 'NullBooleanField',
+        'DT_LONGNVARCHAR' : 'TextField',
+        'DT_NSTRING'      : 'CharField',
+        'DT_NFIXCHAR'     : 'CharField',
+        'DT_NVARCHAR'     : 'CharField',
+    })
+
+    def _cache_key(self):
+        return self.connection.settings_dict['NAME']
+
+    def _caching(self):
+        return self.connection.backend_options['IntrospectionCache']
+
+    def _get_metadata(self, cursor):
+        """
+        Returns the cached table and index metadata, reading all of it with
+        two queries on system.tables and system.indexes if needed. Only used
+        with the IntrospectionCache option, otherwise every table is queried
+        on its own.
+        """
+        key = self._cache_key()
+        entry = _metadata.get(key)
+        if entry is not None:
+            expires, metadata = entry
+            if expires is None or expires > time.time():
+                return metadata
+
+        metadata = {'tables': [], 'indexes': {}, 'descriptions': {}}
+        primary_keys = {}
+        cursor.execute("SELECT name, table_primary_key FROM system.tables")
+        for name, primary_key in cursor.fetchall():
+            name = name.strip()
+            metadata['tables'].append(name)
+            # Advantage compares names case insensitively
+            metadata['indexes'][name.lower()] = {}
+            primary_keys[name.lower()] = (primary_key or '').strip()
+
+        cursor.execute("""
+        SELECT parent, name, index_expression,
+               IIF( index_options & 1 = 1, 1, 0 ) as unq
+        FROM system.indexes
+        """)
+        for parent, name, expr, unique in cursor.fetchall():
+            parent = parent.strip().lower()
+            metadata['indexes'].setdefault(parent, {})[expr.strip()] = {
+                'primary_key': (primary_keys.get(parent) == name.strip()),
+                'unique': (unique == 1) }
+
+        ttl = self.connection.backend_options['IntrospectionCacheTTL']
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        _metadata_lock.acquire()
+        try:
+            _metadata[key] = (expires, metadata)
+        finally:
+            _metadata_lock.release()
+        return metadata
+
+    def invalidate(self):
+        "Drops the cached metadata of this connection's data source."
+        _metadata_lock.acquire()
+        try:
+            _metadata.pop(self._cache_key(), None)
+        finally:
+            _metadata_lock.release()
 
     def get_table_list(self, cursor):
         "Returns a list of table names in the current database."
-        cursor.execute("SELECT name FROM system.tables")
-        return [row[0].strip() for row in cursor.fetchall()]
+        if not self._caching():
+            cursor.execute("SELECT name FROM system.tables")
+            return [row[0].strip() for row in cursor.fetchall()]
+        return list(self._get_metadata(cursor)['tables'])
 
     def get_table_description(self, cursor, table_name):
         "Returns a description of the table, with the DB-API cursor.description interface."
-        cursor.execute("SELECT TOP 1 * FROM %s" % self.connection.ops.quote_name(table_name))
-        return cursor.description
+        if not self._caching():
+            cursor.execute("SELECT TOP 1 * FROM %s" % self.connection.ops.quote_name(table_name))
+            return cursor.description
+        descriptions = self._get_metadata(cursor)['descriptions']
+        if table_name not in descriptions:
+            cursor.execute("SELECT TOP 1 * FROM %s" % self.connection.ops.quote_name(table_name))
+            descriptions[table_name] = cursor.description
+        return descriptions[table_name]
 
     def _name_to_index(self, cursor, table_name):
         """
@@ -61,23 +138,24 @@ class DatabaseIntrospection(BaseDatabaseIntrospection):
             {'primary_key': boolean representing whether it's the primary key,
              'unique': boolean representing whether it's a unique index}
         """
-        cursor.execute("""
-        SELECT ix.name,
-               ix.index_expression,
-               IIF( ix.index_options & 1 = 1, 1, 0 ) as unq,
-               (SELECT IIF( table_primary_key = ix.name, 1, 0 )
-        FROM system.tables
-        WHERE name = '%s') as pk
-        FROM system.indexes ix WHERE parent = '%s'
-        """ % (table_name, table_name))
-
-        indexes = {}
-        for name, expr, unique, pk in cursor.fetchall():
-            indexes[expr.strip()] = {
-                'primary_key': (pk == 1),
-                'unique': (unique == 1) }
+        if not self._caching():
+            cursor.execute("""
+            SELECT ix.name,
+                   ix.index_expression,
+                   IIF( ix.index_options & 1 = 1, 1, 0 ) as unq,
+                   (SELECT IIF( table_primary_key = ix.name, 1, 0 )
+            FROM system.tables
+            WHERE name = '%s') as pk
+            FROM system.indexes ix WHERE parent = '%s'
+            """ % (table_name, table_name))
 
-        return indexes
+            indexes = {}
+            for name, expr, unique, pk in cursor.fetchall():
+                indexes[expr.strip()] = {
+                    'primary_key': (pk == 1),
+                    'unique': (unique == 1) }
+            return indexes
+        return dict(self._get_metadata(cursor)['indexes'].get(table_name.lower(), {}))
 
     def get_field_type(self, data_type, row):
         """
@@ -0,0 +1,480 @@
+"""
+Streams CSV or JSON lines files into the table of a model.
+
+Records are read, skipped, batched and converted lazily, so files of any
+size load in constant memory. Values are converted according to the column
+type each model field is created with (see DatabaseCreation.data_types) and
+passed through the field's get_db_prep_save. Batches are inserted with
+executemany by --workers threads, each on its own connection, and committed
+in input order.
+"""
+
+import codecs
+import csv
+import datetime
+import decimal
+import itertools
+import sys
+import threading
+import time
+import Queue
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction, DatabaseError, DEFAULT_DB_ALIAS
+from django.db.models import get_model
+from django.db.models.sql import InsertQuery
+from django.utils import simplejson
+
+from adsdb_django.converters import convert_date, convert_timestamp
+from adsdb_django.driver import Database
+
+
+def convert_bool(value):
+    if isinstance(value, basestring):
+        value = value.strip().lower()
+        if value in ('1', 't', 'true', 'y', 'yes'):
+            return True
+        if value in ('0', 'f', 'false', 'n', 'no'):
+            return False
+        raise ValueError("%r is not a boolean" % value)
+    return bool(value)
+
+def convert_time(value):
+    if isinstance(value, datetime.time):
+        return value
+    return Database.ads_typecast_time(value)
+
+def convert_text(value):
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+# Advantage column type -> converter of values read from a file
+type_converters = {
+    'autoinc': int,
+    'integer': int,
+    'short': int,
+    'double': float,
+    'numeric': lambda value: decimal.Decimal(str(value).strip()),
+    'logical': convert_bool,
+    'date': convert_date,
+    'timestamp': convert_timestamp,
+    'time': convert_time,
+    'nvarchar': convert_text,
+    'nmemo': convert_text,
+}
+
+# Column types whose values are sent as they are converted
+plain_types = ('autoinc', 'integer', 'short', 'double', 'logical',
+               'nvarchar', 'nmemo')
+
+
+def column_type(field, connection):
+    "Returns the Advantage type of a field's column without its size, e.g. 'nvarchar'."
+    db_type = field.db_type(connection=connection) or ''
+    return db_type.split('(')[0].strip().lower()
+
+def field_converter(field, connection):
+    """
+    Returns a function converting a value read from a file to a parameter
+    for the field's column. Empty strings become None, except in character
+    columns that don't allow NULL.
+    """
+    kind = column_type(field, connection)
+    convert = type_converters.get(kind, convert_text)
+    text = kind in ('nvarchar', 'nmemo')
+    keep_empty = text and not field.null
+    if kind in plain_types:
+        prep = None
+    else:
+        prep = lambda value: field.get_db_prep_save(value, connection=connection)
+
+    def converter(value):
+        if value is None or (value == '' and not keep_empty):
+            return None
+        value = convert(value)
+        if prep is not None:
+            value = prep(value)
+        return value
+    return converter
+
+
+def read_csv(fp, columns, delimiter, encoding):
+    "Yields the column names (from the header unless given) then each record."
+    reader = csv.reader(fp, delimiter=delimiter)
+    if columns is None:
+        columns = [name.decode(encoding).strip() for name in reader.next()]
+    yield columns
+    for record in reader:
+        if record:
+            yield [value.decode(encoding) for value in record]
+
+def read_json_lines(fp, columns, delimiter, encoding):
+    "Yields the column names (those of the first record unless given) then each record."
+    lines = (line for line in codecs.getreader(encoding)(fp) if line.strip())
+    first = None
+    if columns is None:
+        for line in lines:
+            first = simplejson.loads(line)
+            columns = first.keys()
+            break
+        else:
+            columns = []
+    yield columns
+    if first is not None:
+        yield [first.get(name) for name in columns]
+    for line in lines:
+        record = simplejson.loads(line)
+        yield [record.get(name) for name in columns]
+
+readers = {
+    'csv': read_csv,
+    'jsonl': read_json_lines,
+}
+
+
+def field_map(model):
+    "Returns a dictionary of name, attname and column -> field."
+    fields = {}
+    for f in model._meta.local_fields:
+        for name in (f.name, f.attname, f.column):
+            fields.setdefault(name, f)
+    return fields
+
+def model_records(filenames, model, fields, read, columns, delimiter, encoding):
+    """
+    Yields the records of all files as lists of values in the order of
+    fields. Files may order their columns differently.
+    """
+    by_name = field_map(model)
+    for filename in filenames:
+        if filename == '-':
+            fp = sys.stdin
+        else:
+            fp = open(filename, 'rb')
+        try:
+            records = read(fp, columns, delimiter, encoding)
+            names = records.next()
+            positions = {}
+            for i, name in enumerate(names):
+                if name not in by_name:
+                    raise CommandError("%s: %s has no field '%s'" % (
+                        filename, model._meta.object_name, name))
+                positions[by_name[name]] = i
+            missing = [f.name for f in fields if f not in positions]
+            if missing:
+                raise CommandError("%s: missing columns %s" % (
+                    filename, ', '.join(missing)))
+            order = [positions[f] for f in fields]
+            for record in records:
+                try:
+                    yield [record[i] for i in order]
+                except IndexError:
+                    raise CommandError("%s: record with %d values, expected %d" % (
+                        filename, len(record), len(names)))
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+
+def batches(records, size):
+    "Groups an iterable into lists of at most size items."
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Progress(object):
+    """
+    Puts the commits of batches loaded by several workers in input order,
+    so that the records before offset, counted from the start of the
+    input, are exactly those committed.
+    """
+    def __init__(self, skip):
+        self.offset = skip
+        self.loaded = 0
+        self.next_batch = 0
+        # Batches from this index on are not committed, see abort
+        self.stop_at = None
+        self.started = time.time()
+        self._condition = threading.Condition()
+
+    def stopped(self, index):
+        return self.stop_at is not None and index >= self.stop_at
+
+    def wait_turn(self, index):
+        """
+        Waits until all batches before index are done. Returns False if the
+        load was stopped before that batch, which must then not be
+        committed.
+        """
+        self._condition.acquire()
+        try:
+            while self.next_batch != index and not self.stopped(index):
+                self._condition.wait(1)
+            return self.next_batch == index and not self.stopped(index)
+        finally:
+            self._condition.release()
+
+    def done(self, index, size):
+        "Records that the batch, whose turn it was, has been committed."
+        self._condition.acquire()
+        try:
+            self.loaded += size
+            self.offset += size
+            self.next_batch = index + 1
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def abort(self, index=None):
+        """
+        Stops committing batches from index on, by default all those not
+        committed yet. Earlier batches are still committed.
+        """
+        self._condition.acquire()
+        try:
+            if index is None:
+                index = self.next_batch
+            if self.stop_at is None or index < self.stop_at:
+                self.stop_at = index
+            self._condition.notifyAll()
+        finally:
+            self._condition.release()
+
+    def rate(self):
+        return self.loaded / max(time.time() - self.started, 1e-6)
+
+
+class Command(BaseCommand):
+    help = ('Loads CSV or JSON lines files into the table of a model, '
+            'in batches on parallel connections.')
+    args = 'app_label.ModelName file [file ...]'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--database', action='store', dest='database',
+            default=DEFAULT_DB_ALIAS, help='Nominates a database to load '
+                'into. Defaults to the "default" database.'),
+        make_option('--format', dest='format', default='csv',
+            choices=sorted(readers.keys()),
+            help='Input format, csv (with a header line) or jsonl (one JSON '
+                'object per line). Defaults to csv.'),
+        make_option('--delimiter', dest='delimiter', default=',',
+            help='CSV field delimiter. Defaults to ",".'),
+        make_option('--encoding', dest='encoding', default='utf-8',
+            help='Input encoding. Defaults to utf-8.'),
+        make_option('--columns', dest='columns',
+            help='Comma separated field names of the input columns, for '
+                'files without a header line.'),
+        make_option('--batch-size', dest='batch_size', type='int',
+            help='Records per executemany call. Defaults to the '
+                'BulkInsertBatchSize option.'),
+        make_option('--workers', dest='workers', type='int', default=1,
+            help='Connections inserting at the same time. More than one '
+                'requires --batch-commits. Defaults to 1.'),
+        make_option('--batch-commits', action='store_true',
+            dest='batch_commits', default=False,
+            help='Commit after every batch instead of loading everything '
+                'in one transaction.'),
+        make_option('--defer-indexes', action='store_true',
+            dest='defer_indexes', default=False,
+            help='Drop the non-unique indexes of the table before loading '
+                'and create them again afterwards.'),
+        make_option('--skip', dest='skip', type='int', default=0,
+            help='Records to skip at the start of the input, e.g. the '
+                'resume offset printed by an interrupted load.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) < 2:
+            raise CommandError("Give a model and at least one file.")
+        label, filenames = args[0], args[1:]
+        try:
+            app_label, model_name = label.split('.')
+        except ValueError:
+            raise CommandError("Give the model as app_label.ModelName.")
+        model = get_model(app_label, model_name)
+        if model is None:
+            raise CommandError("Unknown model: %s" % label)
+
+        self.using = options.get('database', DEFAULT_DB_ALIAS)
+        self.verbosity = int(options.get('verbosity', 1))
+        connection = connections[self.using]
+        workers = options.get('workers') or 1
+        batch_commits = options.get('batch_commits', False)
+        if workers > 1 and not batch_commits:
+            raise CommandError("--workers requires --batch-commits, a single "
+                               "transaction can't span connections.")
+        batch_size = options.get('batch_size') or \
+            connection.backend_options['BulkInsertBatchSize']
+        skip = options.get('skip') or 0
+        columns = options.get('columns')
+        if columns:
+            columns = [name.strip() for name in columns.split(',')]
+
+        # Fields whose columns are loaded. An autoinc column is only loaded
+        # when the input has it.
+        read = readers[options.get('format') or 'csv']
+        fields = self.input_fields(model, filenames, read, columns, options)
+        records = model_records(filenames, model, fields, read, columns,
+                                options.get('delimiter', ','),
+                                options.get('encoding', 'utf-8'))
+        records = itertools.islice(records, skip, None)
+
+        dropped = []
+        if options.get('defer_indexes'):
+            dropped = self.drop_indexes(model)
+        progress = Progress(skip)
+        try:
+            self.load(model, fields, batches(records, batch_size), workers,
+                      batch_commits, progress)
+        finally:
+            if dropped:
+                self.create_indexes(model)
+        if self.verbosity >= 1:
+            self.stdout.write("Loaded %d records into %s in %.1f seconds.\n" % (
+                progress.loaded, model._meta.db_table,
+                time.time() - progress.started))
+
+    def input_fields(self, model, filenames, read, columns, options):
+        "Returns the fields of the columns of the first file, in model order."
+        if columns is None:
+            fp = filenames[0] != '-' and open(filenames[0], 'rb') or None
+            if fp is None:
+                raise CommandError("Give --columns when reading standard input.")
+            try:
+                columns = read(fp, None, options.get('delimiter', ','),
+                               options.get('encoding', 'utf-8')).next()
+            finally:
+                fp.close()
+        by_name = field_map(model)
+        present = set([by_name[name] for name in columns if name in by_name])
+        return [f for f in model._meta.local_fields if f in present]
+
+    def load(self, model, fields, batches, workers, batch_commits, progress):
+        """
+        Feeds numbered batches to the worker threads through a bounded
+        queue, so that reading stays a few batches ahead of inserting.
+        """
+        queue = Queue.Queue(workers * 2)
+        errors = []
+        threads = [threading.Thread(target=self.worker,
+                                    args=(model, fields, queue, batch_commits,
+                                          progress, errors))
+                   for i in range(workers)]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        last_report = time.time()
+        try:
+            for index, batch in enumerate(batches):
+                while not errors:
+                    try:
+                        queue.put((index, batch), timeout=1)
+                        break
+                    except Queue.Full:
+                        pass
+                if errors:
+                    break
+                if self.verbosity >= 1 and time.time() - last_report >= 1:
+                    last_report = time.time()
+                    self.report(progress, batch_commits)
+        except:
+            # Reading failed or was interrupted, the workers roll back
+            errors.append(sys.exc_info())
+            progress.abort()
+        finally:
+            for thread in threads:
+                queue.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            if batch_commits:
+                self.stderr.write("Records before offset %d are loaded, "
+                                 "continue with --skip %d.\n" % (
+                                     progress.offset, progress.offset))
+            raise errors[0][0], errors[0][1], errors[0][2]
+
+    def worker(self, model, fields, queue, batch_commits, progress, errors):
+        "Converts and inserts batches from the queue until it gets None."
+        using = self.using
+        # Connections are thread local, this is the worker's own
+        connection = connections[using]
+        converters = [field_converter(f, connection) for f in fields]
+        query = InsertQuery(model)
+        query.insert_values([(f, None) for f in fields])
+        compiler = query.get_compiler(using=using)
+        transaction.enter_transaction_management(using=using)
+        transaction.managed(True, using=using)
+        try:
+            while True:
+                item = queue.get()
+                if item is None:
+                    break
+                index, batch = item
+                # Batches before a failed one are still loaded
+                if progress.stopped(index):
+                    continue
+                try:
+                    rows = self.convert(batch, converters)
+                    compiler.execute_bulk(rows, len(rows))
+                    # Batches are committed in input order, so that a
+                    # failure leaves no committed batch after the offset
+                    if not progress.wait_turn(index):
+                        transaction.rollback(using=using)
+                        continue
+                    if batch_commits:
+                        transaction.commit(using=using)
+                    progress.done(index, len(rows))
+                except Exception:
+                    errors.append(sys.exc_info())
+                    progress.abort(index)
+                    transaction.rollback(using=using)
+            if not errors:
+                transaction.commit(using=using)
+            else:
+                transaction.rollback(using=using)
+        finally:
+            transaction.leave_transaction_management(using=using)
+            connection.close()
+
+    def convert(self, batch, converters):
+        "Converts a batch column by column and returns its rows as tuples."
+        columns = zip(*batch)
+        return zip(*[map(convert, values)
+                     for convert, values in zip(converters, columns)])
+
+    def report(self, progress, batch_commits):
+        message = "%d records loaded, %.0f records/s" % (
+            progress.loaded, progress.rate())
+        if batch_commits:
+            message += ", resume offset %d" % progress.offset
+        self.stdout.write(message + "\n")
+
+    def drop_indexes(self, model):
+        "Drops the table's non-unique indexes, returns the statements run."
+        connection = connections[self.using]
+        statements = connection.creation.sql_destroy_indexes_for_model(
+            model, no_style())
+        cursor = connection.cursor()
+        for sql in statements:
+            try:
+                cursor.execute(sql)
+            except DatabaseError:
+                # The index was already missing
+                pass
+        transaction.commit_unless_managed(using=self.using)
+        return statements
+
+    def create_indexes(self, model):
+        connection = connections[self.using]
+        if self.verbosity >= 1:
+            self.stdout.write("Creating the indexes of %s.\n" % model._meta.db_table)
+        cursor = connection.cursor()
+        for sql in connection.creation.sql_indexes_for_model(model, no_style()):
+            cursor.execute(sql)
+        transaction.commit_unless_managed(using=self.using)
@@ -0,0 +1,109 @@
+"""
+Runs independent queries at the same time on a bounded pool of threads, so
+that a view issuing several of them waits for the slowest round trip rather
+than for the sum of them.
+
+Requires concurrent.futures (the futures package on Python 2). Every task
+runs in a worker thread with its own connections. An Advantage connection is
+kept open for the thread's next task when the task leaves it idle, so only
+the first task of a worker pays for logging in; with PoolMaxSize it is given
+back to the pool instead. Tasks run outside the caller's transaction and
+don't see its uncommitted changes.
+"""
+
+import threading
+
+from django.db import connections
+
+from adsdb_django.util import get_futures
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+def get_executor(alias, max_workers):
+    "Returns the thread pool shared by the connections of the given alias."
+    futures = get_futures()
+    if futures is None:
+        raise ImportError("concurrent.futures is not installed, install the "
+                          "futures package")
+    _executors_lock.acquire()
+    try:
+        executor = _executors.get(alias)
+        if executor is None:
+            executor = _executors[alias] = futures.ThreadPoolExecutor(max_workers)
+        return executor
+    finally:
+        _executors_lock.release()
+
+
+def run_task(func, args, kwargs):
+    """
+    Runs a task in a worker thread, then releases the thread's connections,
+    see DatabaseWrapper.task_done. Connections of other backends are closed.
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Connections are thread local, these are the worker's own
+        for connection in connections.all():
+            if hasattr(connection, 'task_done'):
+                connection.task_done()
+            else:
+                connection.close()
+
+def submit(func, *args, **kwargs):
+    """
+    Runs func(*args, **kwargs) in a worker thread of the default database's
+    pool and returns a concurrent.futures.Future for its result. See
+    DatabaseWrapper.submit.
+    """
+    return connections['default'].submit(func, *args, **kwargs)
+
+def evaluate(*querysets, **kwargs):
+    """
+    Evaluates the querysets concurrently and returns a list of their
+    results, in the given order. Raises the exception of a failed query
+    (the first in the given order if several failed before the others
+    finished), or concurrent.futures.TimeoutError if an optional timeout in
+    seconds for the whole call runs out.
+    """
+    timeout = kwargs.get('timeout')
+    pending = [connections[queryset.db].submit(list, queryset)
+               for queryset in querysets]
+    futures = get_futures()
+    done, not_done = futures.wait(pending, timeout,
+                                  return_when=futures.FIRST_EXCEPTION)
+    # Queries still running when one failed or the time ran out are
+    # cancelled if they haven't started
+    for future in pending:
+        if future in done and future.exception() is not None:
+            for other in not_done:
+                other.cancel()
+            raise future.exception()
+    if not_done:
+        for future in not_done:
+            future.cancel()
+        raise futures.TimeoutError()
+    return [future.result() for future in pending]
+
+def get_asyncio():
+    "Returns the asyncio module (or trollius), or None if neither is installed."
+    try:
+        import asyncio
+    except ImportError:
+        try:
+            import trollius as asyncio
+        except ImportError:
+            return None
+    return asyncio
+
+def wrap_future(future, loop=None):
+    """
+    Returns an asyncio future for a concurrent.futures.Future returned by
+    submit, so that coroutines can wait for queries with asyncio.gather.
+    """
+    asyncio = get_asyncio()
+    if asyncio is None:
+        raise ImportError("asyncio is not available")
+    return asyncio.wrap_future(future, loop=loop)
@@ -0,0 +1,201 @@
+"""
+Process wide pool of adsdb connections.
+
+Django opens and closes a connection for every request, and Advantage
+remote server logins are expensive. DatabaseWrapper therefore borrows
+connections from a ConnectionPool shared by all threads of the process
+when PoolMaxSize is set in OPTIONS.
+"""
+
+import threading
+import time
+
+from django.db import utils
+
+
+class PooledConnection(object):
+    """
+    A connection owned by a pool. The info dictionary is scratch space for
+    the borrower which stays with the connection between checkouts.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.info = {}
+        self.uses = 0
+        self.created = self.last_used = self.last_checked = time.time()
+
+
+class ConnectionPool(object):
+    """
+    A bounded pool of connections created by the connect callable.
+
+    Idle connections are handed out most recently used first. They are
+    closed once they have been idle for longer than idle_timeout (keeping at
+    least min_size of them) or are older than max_lifetime. A connection is
+    pinged with con() when it is handed out, but at most once every
+    health_check_interval seconds.
+    """
+    def __init__(self, connect, min_size=0, max_size=10, idle_timeout=300,
+                 max_lifetime=3600, health_check_interval=30, timeout=30):
+        self.connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        self._lock = threading.Condition()
+        self._idle = []
+        self._in_use = {}
+        self._size = 0
+
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.health_check_failures = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def checkout(self):
+        """
+        Returns a PooledConnection, waiting up to timeout seconds for one to
+        be returned when the pool is exhausted. Its uses attribute is 1 if the
+        connection was newly opened.
+        """
+        start = time.time()
+        self._lock.acquire()
+        try:
+            while True:
+                record = self._take_idle()
+                if record is not None:
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._lock.release()
+                    try:
+                        try:
+                            record = PooledConnection(self.connect())
+                        finally:
+                            self._lock.acquire()
+                    except:
+                        self._size -= 1
+                        self._lock.notify()
+                        raise
+                    self.connects += 1
+                    break
+                remaining = start + self.timeout - time.time()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise utils.DatabaseError("Timed out after %s seconds waiting "
+                                              "for a pooled connection" % self.timeout)
+                self._lock.wait(remaining)
+
+            waited = time.time() - start
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+            self.checkouts += 1
+            record.uses += 1
+            self._in_use[id(record)] = record
+            return record
+        finally:
+            self._lock.release()
+
+    def checkin(self, record, discard=False):
+        """
+        Returns a PooledConnection to the pool. The connection is closed
+        instead if discard is True or it has outlived max_lifetime.
+        """
+        self._lock.acquire()
+        try:
+            del self._in_use[id(record)]
+            now = time.time()
+            if discard or now - record.created > self.max_lifetime:
+                self._close(record)
+            else:
+                record.last_used = now
+                self._idle.append(record)
+            self._lock.notify()
+        finally:
+            self._lock.release()
+
+    def _take_idle(self):
+        "Pops a usable idle connection, closing stale ones. Lock must be held."
+        now = time.time()
+        while self._idle:
+            record = self._idle.pop()
+            if now - record.created > self.max_lifetime:
+                self._close(record)
+                continue
+            if now - record.last_checked > self.health_check_interval:
+                try:
+                    record.connection.con()
+                except Exception:
+                    self.health_check_failures += 1
+                    self._close(record)
+                    continue
+                record.last_checked = now
+            self._expire_idle(now)
+            return record
+        return None
+
+    def _expire_idle(self, now):
+        "Closes connections idle for longer than idle_timeout. Lock must be held."
+        # The least recently used connections are at the front of the list
+        while (self._idle and self._size > self.min_size and
+               now - self._idle[0].last_used > self.idle_timeout):
+            self._close(self._idle.pop(0))
+
+    def _close(self, record):
+        self._size -= 1
+        try:
+            record.connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        "Closes all idle connections."
+        self._lock.acquire()
+        try:
+            while self._idle:
+                self._close(self._idle.pop())
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        "Returns a dictionary with the size, usage and wait counters of the pool."
+        self._lock.acquire()
+        try:
+            in_use = len(self._in_use)
+            return {'size': self._size,
+                    'idle': len(self._idle),
+                    'in_use': in_use,
+                    'max_size': self.max_size,
+                    'utilization': float(in_use) / self.max_size,
+                    'checkouts': self.checkouts,
+                    'connects': self.connects,
+                    'timeouts': self.timeouts,
+                    'health_check_failures': self.health_check_failures,
+                    'wait_time': self.wait_time,
+                    'max_wait_time': self.max_wait_time}
+        finally:
+            self._lock.release()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(params, connect, **options):
+    """
+    Returns the pool for the given connection parameters, creating it with
+    the connect callable and options on first use.
+    """
+    key = tuple(sorted(params.items()))
+    _pools_lock.acquire()
+    try:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(connect, **options)
+        return pool
+    finally:
+        _pools_lock.release()
@@ -0,0 +1,206 @@
+"""
+Process wide cache of the results of SELECT statements on read-mostly
+tables, such as code and lookup tables.
+
+Only statements reading nothing but the tables listed in the
+ResultCacheTables option are cached, keyed by their converted SQL and
+parameters. Each table has a generation number which INSERT, UPDATE and
+DELETE statements run through the backend increase, and an entry is only
+used while the generations it was read at are current. Writes made by
+other processes or outside the backend are not seen, so the entries also
+expire after ResultCacheTTL seconds.
+"""
+
+import re
+import threading
+import time
+
+from adsdb_django.util import LRUCache
+
+# Tables a statement reads, as Django and most hand written SQL name them
+table_re = re.compile(r'\b(?:FROM|JOIN)\s+"?([\w$]+)"?', re.I)
+select_re = re.compile(r'\s*SELECT\s', re.I)
+dml_re = re.compile(r'\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+"?([\w$]+)"?', re.I)
+# Statements which may change any table
+other_write_re = re.compile(r'\s*(?:CREATE|DROP|ALTER|EXECUTE)\s', re.I)
+
+
+class CachedResult(object):
+    """
+    Replays a cached result set through the part of the cursor API used by
+    CursorWrapper.
+    """
+    def __init__(self, description, rows):
+        self.description = description
+        self.rows = rows
+        self.rowcount = len(rows)
+        self._position = 0
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        if rows:
+            return rows[0]
+        return None
+
+    def fetchmany(self, size=1):
+        rows = self.rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self.rows))
+
+    def close(self):
+        pass
+
+
+class PrefetchedResult(object):
+    """
+    A result set found too large to cache: replays the rows read ahead to
+    find that out, then reads the rest from the adsdb cursor.
+    """
+    def __init__(self, rows, cursor):
+        self.rows = rows
+        self.cursor = cursor
+        self._position = 0
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        if rows:
+            return rows[0]
+        return None
+
+    def fetchmany(self, size=1):
+        rows = self.rows[self._position:self._position + size]
+        self._position += len(rows)
+        if len(rows) < size:
+            rows.extend(self.cursor.fetchmany(size - len(rows)))
+        return rows
+
+    def fetchall(self):
+        rows = self.rows[self._position:]
+        self._position = len(self.rows)
+        rows.extend(self.cursor.fetchall())
+        return rows
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+
+class ResultCache(object):
+    """
+    Caches at most size results of up to max_rows rows each for ttl seconds.
+    """
+    def __init__(self, tables, size=1000, ttl=300, max_rows=1000):
+        self.tables = set([table.lower() for table in tables])
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.invalidations = 0
+        self._entries = LRUCache(size)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def select_tables(self, sql):
+        """
+        Returns the tables a SELECT reads if they are all cached ones,
+        otherwise None.
+        """
+        if not select_re.match(sql):
+            return None
+        tables = tuple(sorted(set([table.lower() for table in table_re.findall(sql)])))
+        if not tables:
+            return None
+        for table in tables:
+            if table not in self.tables:
+                return None
+        return tables
+
+    def written_tables(self, sql):
+        "Returns the cached tables a statement may change."
+        match = dml_re.match(sql)
+        if match is not None:
+            table = match.group(1).lower()
+            if table in self.tables:
+                return set([table])
+            return set()
+        if other_write_re.match(sql):
+            return set(self.tables)
+        return set()
+
+    def generations(self, tables):
+        self._lock.acquire()
+        try:
+            return tuple([self._generations.get(table, 0) for table in tables])
+        finally:
+            self._lock.release()
+
+    def get(self, key, tables):
+        "Returns the (description, rows) cached under key, or None."
+        now = time.time()
+        self._lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, generations, description, rows = entry
+            current = tuple([self._generations.get(table, 0) for table in tables])
+            if expires < now or generations != current:
+                self._entries.pop(key)
+                # Count the stale entry as the miss it is
+                self._entries.hits -= 1
+                self._entries.misses += 1
+                return None
+            return description, rows
+        finally:
+            self._lock.release()
+
+    def set(self, key, generations, description, rows):
+        """
+        Stores a result read while the tables were at the given generations,
+        which the caller must have taken before running the statement.
+        """
+        if len(rows) > self.max_rows:
+            return
+        self._lock.acquire()
+        try:
+            self._entries.set(key, (time.time() + self.ttl, generations,
+                                    description, rows))
+        finally:
+            self._lock.release()
+
+    def invalidate(self, tables=None):
+        "Drops the results read from the given tables, or all of them."
+        if tables is None:
+            tables = self.tables
+        self._lock.acquire()
+        try:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self.invalidations += 1
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        "Returns a dictionary with the size and counters of the cache."
+        self._lock.acquire()
+        try:
+            stats = self._entries.stats()
+            stats['invalidations'] = self.invalidations
+            return stats
+        finally:
+            self._lock.release()
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_result_cache(alias, tables, **options):
+    "Returns the ResultCache shared by the connections of the given alias."
+    _caches_lock.acquire()
+    try:
+        cache = _caches.get(alias)
+        if cache is None:
+            cache = _caches[alias] = ResultCache(tables, **options)
+        return cache
+    finally:
+        _caches_lock.release()
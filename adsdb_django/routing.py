@@ -0,0 +1,162 @@
+"""
+Spreads read-only statements over several Advantage servers.
+
+With the DataSources option the backend opens connections to the listed
+data sources, typically servers holding replicated data dictionaries, next
+to the one in NAME. CursorWrapper runs a SELECT on one of them unless the
+connection is in a transaction or has written anything since it was opened,
+in which case everything stays on the primary.
+
+A node is chosen at random with a probability proportional to its weight
+divided by its average latency, so slower servers get less traffic. A node
+whose connection fails is ejected and re-admitted after ReplicaEjectTime
+seconds, twice as long after every consecutive failure. An open connection
+that fails is reopened once first, as the server may just have dropped it
+while it was idle.
+"""
+
+import random
+import re
+import threading
+import time
+
+# Statements that may run on a replica. SELECT ... INTO creates a table.
+select_re = re.compile(r'\s*SELECT\s', re.I)
+select_into_re = re.compile(r'\sINTO\s', re.I)
+transaction_re = re.compile(r'\s*(?:BEGIN|COMMIT|ROLLBACK|SAVEPOINT)\b', re.I)
+
+# The latest latency sample counts for this much of a node's average
+LATENCY_DECAY = 0.2
+# Latest ejection time is at most this multiple of ReplicaEjectTime
+MAX_BACKOFF = 16
+
+
+def is_read_only(sql):
+    return bool(select_re.match(sql)) and not select_into_re.search(sql)
+
+def is_write(sql):
+    "Returns True unless a statement only reads or controls the transaction."
+    return not (is_read_only(sql) or transaction_re.match(sql))
+
+
+class Node(object):
+    "A server reads may be sent to. params are its connection parameters."
+    def __init__(self, name, params, weight=1):
+        self.name = name
+        self.params = params
+        self.weight = weight
+        self.latency = None
+        self.failures = 0
+        self.ejected_until = 0
+        self.reads = 0
+        self.ejections = 0
+
+    def as_dict(self):
+        return {'weight': self.weight,
+                'latency': self.latency,
+                'failures': self.failures,
+                'ejected_until': self.ejected_until,
+                'reads': self.reads,
+                'ejections': self.ejections}
+
+
+class ReplicaSet(object):
+    "Latency aware weighted choice among nodes, with ejection of failed ones."
+    def __init__(self, nodes, eject_time=30):
+        self.nodes = nodes
+        self.eject_time = eject_time
+        self._lock = threading.Lock()
+
+    def choose(self):
+        "Returns a node to read from, or None if all of them are ejected."
+        now = time.time()
+        self._lock.acquire()
+        try:
+            available = [node for node in self.nodes if node.ejected_until <= now]
+            if not available:
+                return None
+            # Nodes without samples yet are assumed to be as fast as the others
+            known = [node.latency for node in available if node.latency is not None]
+            default = known and sum(known) / len(known) or 1.0
+            scores = []
+            for node in available:
+                latency = node.latency
+                if latency is None:
+                    latency = default
+                scores.append(node.weight / max(latency, 1e-6))
+            point = random.random() * sum(scores)
+            for node, score in zip(available, scores):
+                point -= score
+                if point < 0:
+                    break
+            node.reads += 1
+            return node
+        finally:
+            self._lock.release()
+
+    def record(self, node, duration):
+        "Adds a latency sample of a successful statement."
+        self._lock.acquire()
+        try:
+            if node.latency is None:
+                node.latency = duration
+            else:
+                node.latency += LATENCY_DECAY * (duration - node.latency)
+            node.failures = 0
+        finally:
+            self._lock.release()
+
+    def eject(self, node):
+        "Stops sending reads to a node that failed, for a while."
+        self._lock.acquire()
+        try:
+            node.failures += 1
+            node.ejections += 1
+            backoff = min(2 ** (node.failures - 1), MAX_BACKOFF)
+            node.ejected_until = time.time() + self.eject_time * backoff
+            # Start over when the node is re-admitted
+            node.latency = None
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        "Returns a dictionary of node name -> counters."
+        self._lock.acquire()
+        try:
+            return dict([(node.name, node.as_dict()) for node in self.nodes])
+        finally:
+            self._lock.release()
+
+
+def parse_data_sources(data_sources, params):
+    """
+    Returns the nodes of the DataSources option, a list of data source
+    strings or of dictionaries with a DataSource, an optional Weight and any
+    connection parameters differing from those of the primary in params.
+    """
+    nodes = []
+    for source in data_sources:
+        if isinstance(source, basestring):
+            source = {'DataSource': source}
+        source = dict(source)
+        weight = source.pop('Weight', 1)
+        node_params = dict(params)
+        node_params.update(source)
+        nodes.append(Node(source['DataSource'], node_params, weight))
+    return nodes
+
+
+_replica_sets = {}
+_replica_sets_lock = threading.Lock()
+
+def get_replica_set(alias, data_sources, params, **options):
+    "Returns the ReplicaSet shared by the connections of the given alias."
+    _replica_sets_lock.acquire()
+    try:
+        replicas = _replica_sets.get(alias)
+        if replicas is None:
+            replicas = _replica_sets[alias] = ReplicaSet(
+                parse_data_sources(data_sources, params), **options)
+        return replicas
+    finally:
+        _replica_sets_lock.release()
@@ -0,0 +1,80 @@
+"""
+Nested transactions for the Advantage backend.
+
+Django 1.3 only has flat transaction management: a commit_on_success block
+inside another one commits the outer block's work too. Atomic blocks may be
+nested instead; the outermost one runs in a transaction and each inner one
+in a savepoint, so an exception only undoes the work of the block it was
+raised in. A block entered while Django's transaction management is already
+active (commit_on_success, TestCase) also runs in a savepoint and leaves
+committing to the enclosing block.
+"""
+
+from __future__ import with_statement
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.utils.functional import wraps
+
+
+class Atomic(object):
+    """
+    A context manager and decorator for an atomic block on the connection
+    alias using. See DatabaseWrapper.atomic.
+
+    The state of the open blocks is kept on the connection, so one instance
+    may be used by several threads and entered recursively.
+    """
+    def __init__(self, using=None):
+        self.using = using or DEFAULT_DB_ALIAS
+
+    def __enter__(self):
+        connection = connections[self.using]
+        # Inside another atomic block, commit_on_success, commit_manually or
+        # a TestCase the transaction belongs to the enclosing block, which
+        # commits or rolls it back, so only a savepoint is taken.
+        if not connection.atomic_blocks and not connection.is_managed():
+            connection.enter_transaction_management()
+            connection.managed(True)
+            connection.atomic_blocks.append(None)
+        else:
+            connection.atomic_blocks.append(connection.savepoint())
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        connection = connections[self.using]
+        sid = connection.atomic_blocks.pop()
+        if sid is not None:
+            if exc_type is None:
+                connection.savepoint_commit(sid)
+            else:
+                connection.savepoint_rollback(sid)
+            return False
+
+        try:
+            if exc_type is None:
+                try:
+                    connection.commit()
+                except:
+                    connection.rollback()
+                    raise
+            else:
+                connection.rollback()
+        finally:
+            connection.leave_transaction_management()
+        return False
+
+    def __call__(self, func):
+        def inner(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wraps(func)(inner)
+
+
+def atomic(using=None):
+    """
+    Returns an atomic block for the connection alias using, for use as a
+    decorator or in a with statement.
+    """
+    if callable(using):
+        # Used as a bare @atomic decorator
+        return Atomic()(using)
+    return Atomic(using)
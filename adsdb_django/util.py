@@ -0,0 +1,180 @@
+"""
+Helpers shared by the Advantage backend modules.
+"""
+
+import array
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python < 2.7
+    from django.utils.datastructures import SortedDict as OrderedDict
+
+
+class LRUCache(object):
+    """
+    A size bounded mapping that discards the least recently used entry once
+    it is full. Hit, miss and eviction counters are kept for monitoring.
+
+    If on_evict is given it is called with (key, value) for every entry
+    pushed out of the cache, so that cached resources can be released.
+    """
+    def __init__(self, maxsize, on_evict=None):
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # Re-insert so the entry becomes the most recently used one
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if key in self._data:
+            del self._data[key]
+        else:
+            while self._data and len(self._data) >= self.maxsize:
+                self._evict()
+        self._data[key] = value
+
+    def pop(self, key, default=None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        if self.on_evict is not None:
+            for key, value in self._data.items():
+                self.on_evict(key, value)
+        self._data.clear()
+
+    def _evict(self):
+        key = iter(self._data).next()
+        value = self._data.pop(key)
+        self.evictions += 1
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def stats(self):
+        "Returns a dictionary with the size and counters of the cache."
+        return {'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions}
+
+
+def get_numpy():
+    "Returns the numpy module, or None if it is not installed."
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def int64_typecode():
+    """
+    Returns an array.array type code for 64 bit integers, or None if there
+    is none: 'q' is new in Python 3.3 and 'l' is 32 bits on Windows.
+    """
+    for typecode in ('q', 'l'):
+        try:
+            if array.array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            pass
+    return None
+
+
+def get_futures():
+    """
+    Returns the concurrent.futures module (from the futures package on
+    Python 2), or None if it is not installed.
+    """
+    try:
+        from concurrent import futures
+    except ImportError:
+        return None
+    return futures
+
+
+class Column(object):
+    """
+    The values of one result column as fetched by
+    CursorWrapper.fetch_columns.
+
+    values is an array.array of the given typecode, or a list when there is
+    none. nulls holds one flag per row, 1 marking a NULL, in which case the
+    value is 0 in a numeric column and None otherwise. to_numpy() turns both into
+    NumPy arrays, using dtype for list values if given.
+    """
+    def __init__(self, name, typecode=None, dtype=None):
+        self.name = name
+        self.typecode = typecode
+        self.dtype = dtype
+        if typecode is None:
+            self.values = []
+        else:
+            self.values = array.array(typecode)
+        # Stands in for NULL in the values
+        self._fill = None
+        if typecode is not None or (dtype or '').startswith('int'):
+            self._fill = 0
+        self.nulls = array.array('b')
+
+    def __len__(self):
+        return len(self.values)
+
+    def extend(self, values, convert=None):
+        """
+        Appends a sequence of fetched values, passing those that aren't NULL
+        through convert if given.
+        """
+        if None in values:
+            fill = self._fill
+            self.nulls.extend([value is None for value in values])
+            if convert is not None:
+                values = [convert(value) if value is not None else fill
+                          for value in values]
+            elif fill is not None:
+                values = [value if value is not None else fill for value in values]
+        else:
+            if convert is not None:
+                values = map(convert, values)
+            self.nulls.extend(array.array('b', [0]) * len(values))
+        self.values.extend(values)
+
+    def to_numpy(self, convert=None):
+        """
+        Replaces the buffers by NumPy arrays. List values NumPy can't read as
+        dtype are passed through convert first if given.
+        """
+        numpy = get_numpy()
+        if self.typecode is not None:
+            self.values = numpy.array(self.values, dtype=self.typecode)
+        elif self.dtype is not None:
+            try:
+                self.values = numpy.array(self.values, dtype=self.dtype)
+            except ValueError:
+                if convert is None:
+                    raise
+                self.values = numpy.array(
+                    [value if value is None else convert(value) for value in self.values],
+                    dtype=self.dtype)
+        else:
+            self.values = numpy.array(self.values, dtype=object)
+        self.nulls = numpy.array(self.nulls, dtype=bool)
@@ -0,0 +1,10 @@
+from django.db import models
+
+class Item(models.Model):
+    name = models.CharField(max_length=50, db_index=True)
+    created = models.DateTimeField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    day = models.DateField()
+
+    class Meta:
+        ordering = ['name']
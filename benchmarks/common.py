@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmark scripts.
+"""
+
+import os
+import platform
+import time
+
+from django.utils import simplejson
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def git_revision():
+    "Returns the commit the benchmarks run against, if known."
+    try:
+        pipe = os.popen('git -C "%s" rev-parse HEAD 2>%s' % (BENCHMARK_DIR, os.devnull))
+        revision = pipe.read().strip()
+        pipe.close()
+        return revision or None
+    except OSError:
+        return None
+
+def write_report(filename, parameters, results, **extra):
+    "Writes the results of a run with a description of the environment as JSON."
+    report = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'revision': git_revision(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'parameters': parameters,
+              'results': results}
+    report.update(extra)
+    fp = open(filename, 'w')
+    try:
+        simplejson.dump(report, fp, indent=1, sort_keys=True)
+    finally:
+        fp.close()
@@ -0,0 +1,199 @@
+"""
+In-process stand-in for the adsdb module, used by the benchmarks to
+measure the backend's own overhead without an Advantage server.
+
+Every SELECT returns RESULT_ROWS rows shaped like RESULT_COLUMNS, with the
+values as strings where the real client leaves conversion to Python. Other
+statements return no rows. LATENCY seconds are slept per execute and per
+fetch round trip to simulate the network, and the ADSDB_IMPORT_DELAY
+environment variable makes importing the module take that many seconds,
+like loading the Advantage client library. The tests in tests/ use it
+too, recording statements in LOG and making servers fail with DOWN.
+"""
+
+import datetime
+import os
+import time
+
+time.sleep(float(os.environ.get('ADSDB_IMPORT_DELAY', 0)))
+
+apilevel = '2.0'
+threadsafety = 1
+paramstyle = 'qmark'
+
+class Error(Exception): pass
+class Warning(Exception): pass
+class InterfaceError(Error): pass
+class DatabaseError(Error): pass
+class DataError(DatabaseError): pass
+class OperationalError(DatabaseError): pass
+class IntegrityError(DatabaseError): pass
+class InternalError(DatabaseError): pass
+class ProgrammingError(DatabaseError): pass
+class NotSupportedError(DatabaseError): pass
+
+_types = ['DATE', 'TIME', 'TIMESTAMP', 'VARCHAR', 'FIXCHAR', 'LONGVARCHAR',
+          'STRING', 'DOUBLE', 'FLOAT', 'DECIMAL', 'INT', 'SMALLINT', 'BINARY',
+          'LONGBINARY', 'TINYINT', 'BIGINT', 'UNSINT', 'UNSSMALLINT',
+          'UNSBIGINT', 'BIT', 'LONGNVARCHAR', 'NSTRING', 'NFIXCHAR', 'NVARCHAR']
+for _code, _name in enumerate(_types):
+    globals()['DT_' + _name] = _code + 1
+
+# Simulated round trip time in seconds
+LATENCY = 0.0
+# Rows returned by every SELECT
+RESULT_ROWS = 100
+# (name, DT_* type code) of the result columns
+RESULT_COLUMNS = [('id', DT_INT),
+                  ('name', DT_VARCHAR),
+                  ('created', DT_TIMESTAMP),
+                  ('price', DT_DECIMAL),
+                  ('day', DT_DATE)]
+# Rows returned by the next SELECTs instead of the sample rows, one list per
+# statement. The columns are the first ones of RESULT_COLUMNS.
+RESULTS = []
+# Counters for sanity checks
+executions = 0
+connections = 0
+# When set to a list, (operation, parameters) of every statement, commit
+# and rollback is appended to it
+LOG = None
+# DataSource values of servers that can't be reached. connect fails for
+# them, and so does execute on a connection whose dropped flag is set.
+DOWN = set()
+
+_sample_values = {
+    DT_INT: lambda i: i,
+    DT_VARCHAR: lambda i: 'name %d' % i,
+    DT_TIMESTAMP: lambda i: '2025-03-%02d 12:34:56.789000' % (i % 28 + 1),
+    DT_DECIMAL: lambda i: '%d.25' % i,
+    DT_DATE: lambda i: '2025-03-%02d' % (i % 28 + 1),
+    DT_TIME: lambda i: '12:34:%02d' % (i % 60),
+    DT_BIT: lambda i: i % 2,
+    DT_DOUBLE: lambda i: i * 0.5,
+}
+
+_results = {}
+
+def _result():
+    "Returns (description, rows) for the current settings, built once."
+    key = (RESULT_ROWS, tuple(RESULT_COLUMNS))
+    if key not in _results:
+        description = [(name, code, None, None, None, None, True, code)
+                       for name, code in RESULT_COLUMNS]
+        rows = [tuple([_sample_values.get(code, str)(i) for name, code in RESULT_COLUMNS])
+                for i in range(RESULT_ROWS)]
+        _results[key] = (description, rows)
+    return _results[key]
+
+def _wait():
+    if LATENCY:
+        time.sleep(LATENCY)
+
+
+def ads_typecast_timestamp(s):
+    if not s:
+        return None
+    return datetime.datetime.strptime(s[:19], '%Y-%m-%d %H:%M:%S')
+
+def ads_typecast_date(s):
+    if not s:
+        return None
+    return datetime.datetime.strptime(s, '%Y-%m-%d').date()
+
+def ads_typecast_time(s):
+    if not s:
+        return None
+    return datetime.datetime.strptime(s[:8], '%H:%M:%S').time()
+
+converters = {}
+
+def register_converter(type_code, converter):
+    converters[type_code] = converter
+
+
+class Cursor(object):
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+        self._position = 0
+
+    def execute(self, operation, parameters=()):
+        global executions
+        executions += 1
+        if self.connection.dropped:
+            raise OperationalError(6420, 'connection lost')
+        if LOG is not None:
+            LOG.append((operation, tuple(parameters)))
+        _wait()
+        if operation.lstrip()[:6].upper() != 'SELECT':
+            self.description, self._rows = None, []
+        elif RESULTS:
+            self._rows = RESULTS.pop(0)
+            width = self._rows and len(self._rows[0]) or len(RESULT_COLUMNS)
+            self.description = _result()[0][:width]
+        else:
+            self.description, self._rows = _result()
+        self.rowcount = len(self._rows)
+        self._position = 0
+
+    def executemany(self, operation, seq_of_parameters):
+        for parameters in seq_of_parameters:
+            self.execute(operation, parameters)
+
+    def _fetch(self, size):
+        _wait()
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+    def fetchone(self):
+        rows = self._fetch(1)
+        if rows:
+            return rows[0]
+        return None
+
+    def fetchmany(self, size=1):
+        return self._fetch(size)
+
+    def fetchall(self):
+        return self._fetch(len(self._rows))
+
+    def close(self):
+        self._rows = []
+
+
+class Connection(object):
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.dropped = False
+
+    def cursor(self):
+        return Cursor(self)
+
+    def con(self):
+        _wait()
+
+    def commit(self):
+        if LOG is not None:
+            LOG.append(('COMMIT', ()))
+        _wait()
+
+    def rollback(self):
+        if LOG is not None:
+            LOG.append(('ROLLBACK', ()))
+        _wait()
+
+    def close(self):
+        pass
+
+
+def connect(**kwargs):
+    global connections
+    connections += 1
+    _wait()
+    if kwargs.get('DataSource') in DOWN:
+        raise OperationalError(6420, 'server not found')
+    return Connection(**kwargs)
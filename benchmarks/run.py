@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""
+Measures the overhead of the Advantage backend itself.
+
+The real adsdb module is replaced by the in-process stand-in in fake/, so
+the numbers exclude the server and only show the time spent in
+CursorWrapper, the compiler and the converters. Run from any directory:
+
+    python benchmarks/run.py [--rows N] [--latency SECONDS] [--output FILE]
+
+A summary is printed and, with --output, the results are written as JSON
+for comparing runs over time.
+"""
+
+import os
+import sys
+import time
+from optparse import OptionParser
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+# The stand-in must shadow an installed adsdb
+sys.path[0:0] = [os.path.join(BENCHMARK_DIR, 'fake'), BENCHMARK_DIR,
+                 os.path.dirname(BENCHMARK_DIR)]
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+
+import adsdb
+import django
+from django.db import connections
+
+from adsdb_django.converters import get_row_converter
+from bench_app.models import Item
+from common import write_report
+
+
+BENCHMARKS = []
+
+def benchmark(unit):
+    """
+    Registers a benchmark function, which is called with (connection,
+    number, rows) and returns the number of units it processed.
+    """
+    def register(func):
+        BENCHMARKS.append((func.__name__[len('bench_'):], unit, func))
+        return func
+    return register
+
+
+@benchmark('statement')
+def bench_execute(connection, number, rows):
+    cursor = connection.cursor()
+    for i in xrange(number):
+        cursor.execute('UPDATE bench_app_item SET price = %s WHERE id = %s', [i, i])
+    return number
+
+@benchmark('row')
+def bench_fetchall(connection, number, rows):
+    cursor = connection.cursor()
+    fetched = 0
+    for i in xrange(number):
+        cursor.execute('SELECT id, name, created, price, day FROM bench_app_item')
+        fetched += len(cursor.fetchall())
+    return fetched
+
+@benchmark('row')
+def bench_iterate(connection, number, rows):
+    cursor = connection.cursor()
+    fetched = 0
+    for i in xrange(number):
+        cursor.execute('SELECT id, name, created, price, day FROM bench_app_item')
+        for row in cursor:
+            fetched += 1
+    return fetched
+
+@benchmark('row')
+def bench_fetch_columns(connection, number, rows):
+    cursor = connection.cursor()
+    fetched = 0
+    for i in xrange(number):
+        cursor.execute('SELECT id, name, created, price, day FROM bench_app_item')
+        fetched += len(cursor.fetch_columns()[0])
+    return fetched
+
+@benchmark('row')
+def bench_fetch_columns_python(connection, number, rows):
+    cursor = connection.cursor()
+    fetched = 0
+    for i in xrange(number):
+        cursor.execute('SELECT id, name, created, price, day FROM bench_app_item')
+        fetched += len(cursor.fetch_columns(use_numpy=False)[0])
+    return fetched
+
+# Values of the IN list benchmarks
+IN_LIST_SIZE = 2000
+
+def select_in_list(connection, number):
+    cursor = connection.cursor()
+    ids = range(IN_LIST_SIZE)
+    for i in xrange(number):
+        cursor.execute('SELECT id, name FROM bench_app_item WHERE id IN (%s)'
+                       % ', '.join(['%s'] * len(ids)), ids)
+        cursor.fetchall()
+    return number
+
+@benchmark('statement')
+def bench_in_list(connection, number, rows):
+    return select_in_list(connection, number)
+
+@benchmark('statement')
+def bench_in_list_table(connection, number, rows):
+    connection = connections['in_table']
+    try:
+        return select_in_list(connection, number)
+    finally:
+        connection.close()
+
+@benchmark('row')
+def bench_convert(connection, number, rows):
+    description, raw_rows = adsdb._result()
+    converter = get_row_converter(description)
+    for i in xrange(number):
+        converter.convert(raw_rows)
+    return number * len(raw_rows)
+
+@benchmark('row')
+def bench_queryset(connection, number, rows):
+    fetched = 0
+    for i in xrange(number):
+        fetched += len(list(Item.objects.using(connection.alias)[:rows]))
+    return fetched
+
+@benchmark('query')
+def bench_compile_slice(connection, number, rows):
+    query = Item.objects.filter(name__startswith='a')[20:30].query
+    for i in xrange(number):
+        query.get_compiler(connection.alias).as_sql()
+    return number
+
+@benchmark('query')
+def bench_compile_distinct_slice(connection, number, rows):
+    query = Item.objects.filter(price__gt=1).distinct()[20:30].query
+    for i in xrange(number):
+        query.get_compiler(connection.alias).as_sql()
+    return number
+
+@benchmark('connection')
+def bench_connect(connection, number, rows):
+    for i in xrange(number):
+        connection.close()
+        connection.cursor()
+    return number
+
+@benchmark('connection')
+def bench_connect_pooled(connection, number, rows):
+    connection = connections['pooled']
+    for i in xrange(number):
+        connection.close()
+        connection.cursor()
+    connection.close()
+    return number
+
+
+def run(func, connection, number, repeat, rows):
+    "Returns the best time of repeat runs and the units processed per run."
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        units = func(connection, number, rows)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, units
+
+def main():
+    parser = OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('--rows', type='int', default=100,
+                      help='rows returned by every SELECT (default 100)')
+    parser.add_option('--latency', type='float', default=0.0,
+                      help='simulated round trip time in seconds (default 0)')
+    parser.add_option('--number', type='int', default=200,
+                      help='operations per run (default 200)')
+    parser.add_option('--repeat', type='int', default=5,
+                      help='runs per benchmark, the best is reported (default 5)')
+    parser.add_option('--output', metavar='FILE',
+                      help='write the results as JSON to FILE')
+    options, names = parser.parse_args()
+
+    adsdb.LATENCY = options.latency
+    adsdb.RESULT_ROWS = options.rows
+    connection = connections['default']
+
+    results = {}
+    for name, unit, func in BENCHMARKS:
+        if names and name not in names:
+            continue
+        seconds, units = run(func, connection, options.number, options.repeat,
+                             options.rows)
+        results[name] = {'unit': unit,
+                         'units': units,
+                         'seconds': seconds,
+                         'per_unit_us': seconds / units * 1e6,
+                         'per_second': seconds and units / seconds or None}
+        print '%-24s %10.2f us/%-10s %12.0f/s' % (
+            name, results[name]['per_unit_us'], unit,
+            results[name]['per_second'] or 0)
+    connection.close()
+
+    if options.output:
+        write_report(options.output,
+                     {'rows': options.rows,
+                      'latency': options.latency,
+                      'number': options.number,
+                      'repeat': options.repeat},
+                     results, django=django.get_version())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+# Django settings for the benchmarks, see run.py
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'benchmark.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT'},
+    },
+    # The same database through a connection pool
+    'pooled': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'benchmark.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT', 'PoolMaxSize': 1},
+    },
+    # Large IN lists loaded into temporary tables
+    'in_table': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'benchmark.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT', 'InListTableThreshold': 1000},
+    },
+}
+
+INSTALLED_APPS = ['bench_app']
+
+DEBUG = False
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Measures the cold start cost of the Advantage backend: the time to import
+it and to set up Django's connection handler, whether adsdb gets loaded
+along the way, and the time until the first query returns.
+
+Every sample runs in a fresh interpreter with the adsdb stand-in from
+fake/, optionally slowed down with --import-delay to model loading the
+Advantage client library:
+
+    python benchmarks/startup.py [--samples N] [--import-delay SECONDS] [--output FILE]
+"""
+
+import os
+import subprocess
+import sys
+from optparse import OptionParser
+
+from django.utils import simplejson
+
+from common import BENCHMARK_DIR, write_report
+
+# Run in the child interpreter; prints one JSON sample
+CHILD = """
+import os, sys, time
+start = time.time()
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'
+from django.db import connection
+import adsdb_django.base
+backend = connection.ops
+imported = time.time()
+driver_loaded = 'adsdb' in sys.modules
+from bench_app.models import Item
+list(Item.objects.all()[:1])
+queried = time.time()
+from django.utils import simplejson
+print simplejson.dumps({'import': imported - start,
+                        'first_query': queried - start,
+                        'driver_loaded_on_import': driver_loaded})
+"""
+
+
+def sample(import_delay):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([os.path.join(BENCHMARK_DIR, 'fake'),
+                                         BENCHMARK_DIR,
+                                         os.path.dirname(BENCHMARK_DIR),
+                                         env.get('PYTHONPATH', '')])
+    env['ADSDB_IMPORT_DELAY'] = str(import_delay)
+    process = subprocess.Popen([sys.executable, '-c', CHILD], env=env,
+                               stdout=subprocess.PIPE)
+    output = process.communicate()[0]
+    if process.returncode:
+        raise RuntimeError("Startup sample failed with status %d" % process.returncode)
+    return simplejson.loads(output)
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def main():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--samples', type='int', default=10,
+                      help='interpreters started (default 10)')
+    parser.add_option('--import-delay', type='float', default=0.0,
+                      help='seconds importing adsdb takes (default 0)')
+    parser.add_option('--output', metavar='FILE',
+                      help='write the results as JSON to FILE')
+    options, args = parser.parse_args()
+
+    samples = [sample(options.import_delay) for i in range(options.samples)]
+    results = {}
+    for name in ('import', 'first_query'):
+        values = [s[name] for s in samples]
+        results[name] = {'min': min(values), 'median': median(values),
+                         'max': max(values)}
+        print '%-12s min %8.2f ms  median %8.2f ms  max %8.2f ms' % (
+            name, results[name]['min'] * 1000, results[name]['median'] * 1000,
+            results[name]['max'] * 1000)
+    results['driver_loaded_on_import'] = samples[0]['driver_loaded_on_import']
+    print 'adsdb loaded on import: %s' % results['driver_loaded_on_import']
+
+    if options.output:
+        write_report(options.output,
+                     {'samples': options.samples,
+                      'import_delay': options.import_delay},
+                     results)
+
+if __name__ == '__main__':
+    main()
@@ -8,5 +8,6 @@ setup(name='adsdb_django',
       author='Peter Funk',
       author_email='peter.funk@ianywhere.com',
       url='http://code.google.com/p/adsdb-django',
-      packages=['adsdb_django'],
+      packages=['adsdb_django', 'adsdb_django.management',
+                'adsdb_django.management.commands'],
       )
@@ -0,0 +1,45 @@
+# Django settings for the tests, see testenv.py
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'test.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT'},
+    },
+    # Caches results of up to 10 rows from bench_app_item
+    'cached': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'test.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT',
+                    'ResultCacheTables': ['bench_app_item'],
+                    'ResultCacheMaxRows': 10},
+    },
+    # Loads IN lists of 5 or more values into temporary tables
+    'inlist': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'test.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT',
+                    'InListTableThreshold': 5,
+                    'MaxInListSize': 4,
+                    'ResultCacheTables': ['bench_app_item']},
+    },
+    # Reads go to the replica1.add and replica2.add data sources
+    'replicas': {
+        'ENGINE': 'adsdb_django',
+        'NAME': 'test.add',
+        'USER': 'ADSSYS',
+        'PASSWORD': '',
+        'OPTIONS': {'TableType': 'ADT',
+                    'DataSources': ['replica1.add', 'replica2.add']},
+    },
+}
+
+INSTALLED_APPS = ['bench_app', 'testapp', 'adsdb_django']
+
+DEBUG = False
@@ -0,0 +1,125 @@
+"""
+Tests of the adsbulkload management command.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from StringIO import StringIO
+
+import testenv
+
+import adsdb
+from django.core.management import call_command
+from django.db import connection, DatabaseError
+
+from adsdb_django.management.commands.adsbulkload import Progress
+
+
+class ProgressTests(unittest.TestCase):
+    def test_batches_are_committed_in_order(self):
+        progress = Progress(100)
+        committed = []
+
+        def load(index, delay):
+            time.sleep(delay)
+            if progress.wait_turn(index):
+                committed.append(index)
+                progress.done(index, 10)
+        threads = [threading.Thread(target=load, args=(index, delay))
+                   for index, delay in [(0, 0.05), (1, 0), (2, 0.02)]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(committed, [0, 1, 2])
+        self.assertEqual(progress.offset, 130)
+
+    def test_batches_from_failed_one_are_not_committed(self):
+        progress = Progress(0)
+        progress.done(0, 10)
+        progress.abort(2)
+        self.assertTrue(progress.wait_turn(1))
+        progress.done(1, 10)
+        self.assertFalse(progress.wait_turn(2))
+        self.assertFalse(progress.wait_turn(3))
+        self.assertEqual(progress.offset, 20)
+
+    def test_abort_stops_all_uncommitted_batches(self):
+        progress = Progress(0)
+        progress.done(0, 10)
+        progress.abort()
+        self.assertFalse(progress.wait_turn(1))
+        self.assertEqual(progress.offset, 10)
+
+
+class BulkLoadTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp(suffix='.csv')
+        f = os.fdopen(fd, 'w')
+        f.write('name,created,price,day\n')
+        for i in range(50):
+            f.write('n%d,2025-01-02 03:04:05,%d.5,2025-01-02\n' % (i, i))
+        f.close()
+        adsdb.LOG = []
+
+    def tearDown(self):
+        adsdb.LOG = None
+        os.remove(self.filename)
+        connection.close()
+
+    def inserted(self):
+        return [parameters[0] for operation, parameters in adsdb.LOG
+                if operation.startswith('INSERT')]
+
+    def test_load(self):
+        call_command('adsbulkload', 'bench_app.Item', self.filename,
+                     batch_size=20, verbosity=0)
+        names = self.inserted()
+        self.assertEqual(len(names), 50)
+        self.assertEqual(names[-1], 'n49')
+
+    def test_failure_reports_resume_offset(self):
+        # Names inserted per connection since its last commit, and committed
+        pending = {}
+        committed = []
+        executemany = adsdb.Cursor.executemany
+        commit = adsdb.Connection.commit
+        rollback = adsdb.Connection.rollback
+
+        def failing_executemany(cursor, operation, seq_of_parameters):
+            names = [p[0] for p in seq_of_parameters]
+            if 'n25' in names:
+                raise adsdb.DatabaseError('failed')
+            pending.setdefault(cursor.connection, []).extend(names)
+            return executemany(cursor, operation, seq_of_parameters)
+
+        def recording_commit(connection):
+            committed.extend(pending.pop(connection, []))
+            return commit(connection)
+
+        def recording_rollback(connection):
+            pending.pop(connection, None)
+            return rollback(connection)
+        adsdb.Cursor.executemany = failing_executemany
+        adsdb.Connection.commit = recording_commit
+        adsdb.Connection.rollback = recording_rollback
+        stderr = StringIO()
+        try:
+            self.assertRaises(DatabaseError, call_command, 'adsbulkload',
+                              'bench_app.Item', self.filename, batch_size=5,
+                              workers=3, batch_commits=True, verbosity=0,
+                              stderr=stderr)
+        finally:
+            adsdb.Cursor.executemany = executemany
+            adsdb.Connection.commit = commit
+            adsdb.Connection.rollback = rollback
+        self.assertTrue('--skip 25.' in stderr.getvalue())
+        # Exactly the records before the offset were committed
+        self.assertEqual(sorted(committed, key=lambda name: int(name[1:])),
+                         ['n%d' % i for i in range(25)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Tests of CursorWrapper.fetch_columns and its Column buffers.
+"""
+
+import datetime
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connection
+
+from adsdb_django.util import Column
+
+
+class ColumnTests(unittest.TestCase):
+    def test_nulls_in_array_column(self):
+        column = Column('price', 'd')
+        column.extend(('1.5', None, '2'), float)
+        self.assertEqual(list(column.values), [1.5, 0.0, 2.0])
+        self.assertEqual(list(column.nulls), [0, 1, 0])
+
+    def test_nulls_in_list_column(self):
+        column = Column('name')
+        column.extend(('a', None))
+        column.extend(('b',))
+        self.assertEqual(column.values, ['a', None, 'b'])
+        self.assertEqual(list(column.nulls), [0, 1, 0])
+
+
+class FetchColumnsTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.RESULT_ROWS = 250
+
+    def tearDown(self):
+        adsdb.RESULT_ROWS = 100
+        connection.close()
+
+    def test_matches_fetchall(self):
+        cursor = connection.cursor()
+        cursor.execute('SELECT id, name, created, price, day FROM bench_app_item')
+        rows = cursor.fetchall()
+        cursor.execute('SELECT id, name, created, price, day FROM bench_app_item')
+        columns = cursor.fetch_columns(size=100, use_numpy=False)
+        self.assertEqual([column.name for column in columns],
+                         ['id', 'name', 'created', 'price', 'day'])
+        self.assertEqual(list(columns[0].values), [row[0] for row in rows])
+        self.assertEqual(columns[1].values, [row[1] for row in rows])
+        self.assertEqual(columns[2].values, [row[2] for row in rows])
+        self.assertEqual(list(columns[3].values), [float(row[3]) for row in rows])
+        self.assertEqual(columns[4].values, [row[4] for row in rows])
+        self.assertTrue(isinstance(columns[2].values[0], datetime.datetime))
+
+
+if __name__ == '__main__':
+    unittest.main()
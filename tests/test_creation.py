@@ -0,0 +1,58 @@
+"""
+Tests of the TestDatabaseTemplate schema digest.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import testenv
+
+from django.conf import settings
+from django.db import connection
+
+
+class SchemaDigestTests(unittest.TestCase):
+    def setUp(self):
+        self.fixture_dirs = settings.FIXTURE_DIRS
+        self.fixture_dir = tempfile.mkdtemp()
+        settings.FIXTURE_DIRS = (self.fixture_dir,)
+
+    def tearDown(self):
+        settings.FIXTURE_DIRS = self.fixture_dirs
+        shutil.rmtree(self.fixture_dir)
+        connection.ops.flush_mode = connection.backend_options['FlushMode']
+
+    def write_fixture(self, name, content):
+        fixture = open(os.path.join(self.fixture_dir, name), 'w')
+        try:
+            fixture.write(content)
+        finally:
+            fixture.close()
+
+    def test_digest_is_stable(self):
+        self.assertEqual(connection.creation._schema_digest(),
+                         connection.creation._schema_digest())
+
+    def test_initial_data_changes_digest(self):
+        digest = connection.creation._schema_digest()
+        self.write_fixture('initial_data.json', '[]')
+        with_fixture = connection.creation._schema_digest()
+        self.assertNotEqual(with_fixture, digest)
+        self.write_fixture('initial_data.json', '[ ]')
+        self.assertNotEqual(connection.creation._schema_digest(), with_fixture)
+
+    def test_other_fixtures_are_ignored(self):
+        digest = connection.creation._schema_digest()
+        self.write_fixture('sample.json', '[]')
+        self.assertEqual(connection.creation._schema_digest(), digest)
+
+    def test_flush_mode_changes_digest(self):
+        digest = connection.creation._schema_digest()
+        connection.ops.flush_mode = 'zap'
+        self.assertNotEqual(connection.creation._schema_digest(), digest)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests of adsdb_django.helpers.
+"""
+
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connection
+
+from adsdb_django.helpers import bulk_insert, chunked_delete, chunked_update, keyset_page
+from bench_app.models import Item
+from testapp.models import Part
+
+
+class BulkInsertTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+
+    def tearDown(self):
+        adsdb.LOG = None
+        connection.close()
+
+    def test_generated_keys_are_read_after_each_row(self):
+        # The stand-in's single row has 0 in its first column
+        adsdb.RESULT_ROWS = 1
+        try:
+            items = bulk_insert([Item(name='a'), Item(name='b')])
+        finally:
+            adsdb.RESULT_ROWS = 100
+        statements = [operation for operation, parameters in adsdb.LOG]
+        self.assertEqual(len([s for s in statements if s.startswith('INSERT')]), 2)
+        self.assertTrue(statements[2].startswith('SELECT LASTAUTOINC'))
+        self.assertTrue(statements[4].startswith('SELECT LASTAUTOINC'))
+        self.assertEqual([item.pk for item in items], [0, 0])
+
+
+class KeysetTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+
+    def tearDown(self):
+        adsdb.LOG = None
+        connection.close()
+
+    def last_query(self):
+        return adsdb.LOG[-1]
+
+    def test_null_in_ascending_column(self):
+        keyset_page(Item.objects.all(), 10, after=(None, 5))
+        sql, params = self.last_query()
+        self.assertTrue('"name" IS NOT NULL' in sql)
+        self.assertTrue('"name" IS NULL' in sql)
+        self.assertEqual(params, (5,))
+
+    def test_null_in_descending_column(self):
+        keyset_page(Item.objects.order_by('-created'), 10, after=(None, 5))
+        sql, params = self.last_query()
+        # Nothing sorts after NULL in descending order but rows with the
+        # same NULL and a greater key
+        self.assertTrue('"created" IS NULL' in sql)
+        self.assertFalse('"created" <' in sql)
+        self.assertEqual(params, (5,))
+
+    def test_descending_value_is_followed_by_nulls(self):
+        keyset_page(Item.objects.order_by('-price'), 10, after=(3, 5))
+        sql, params = self.last_query()
+        self.assertTrue('"price" < ?' in sql)
+        self.assertTrue('"price" IS NULL' in sql)
+
+    def test_relation_ordering_is_rejected(self):
+        self.assertRaises(ValueError, keyset_page, Part.objects.order_by('item'), 10)
+        self.assertEqual(adsdb.LOG, [])
+
+
+class ChunkedTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+
+    def tearDown(self):
+        adsdb.LOG = None
+        adsdb.RESULTS = []
+        connection.close()
+
+    def statements(self, verb):
+        return [(operation, parameters) for operation, parameters in adsdb.LOG
+                if operation.startswith(verb)]
+
+    def test_update_in_key_ranges(self):
+        # Upper bounds of the first two batches, then no rows are left
+        adsdb.RESULTS = [[(2,)], [(4,)], []]
+        chunked_update(Item.objects.filter(name='a'), {'name': 'b'}, batch_size=2)
+        updates = self.statements('UPDATE')
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(updates[0][1], ('b', 'a', 2))
+        self.assertEqual(updates[1][1], ('b', 'a', 2, 4))
+        self.assertEqual(updates[2][1], ('b', 'a', 4))
+
+    def test_delete_with_join_fetches_keys(self):
+        # Batch bound, keys of the batch, no bound and no keys left
+        adsdb.RESULTS = [[(5,)], [(3,), (5,)], [], []]
+        chunked_delete(Part.objects.filter(item__name='a'), batch_size=2)
+        deletes = self.statements('DELETE')
+        self.assertEqual(len(deletes), 1)
+        sql, parameters = deletes[0]
+        self.assertFalse('SELECT' in sql)
+        self.assertEqual(parameters, (3, 5))
+
+    def test_delete_without_join(self):
+        adsdb.RESULTS = [[]]
+        chunked_delete(Item.objects.filter(name='a'), batch_size=2)
+        deletes = self.statements('DELETE')
+        self.assertEqual(len(deletes), 1)
+        self.assertFalse('SELECT' in deletes[0][0])
+        self.assertEqual(deletes[0][1], ('a',))
+
+
+if __name__ == '__main__':
+    unittest.main()
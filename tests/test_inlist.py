@@ -0,0 +1,101 @@
+"""
+Tests of the InListTableThreshold rewrite of large IN lists.
+"""
+
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connections
+
+from adsdb_django import introspection
+from bench_app.models import Item
+
+
+class InListTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+        self.connection = connections['inlist']
+
+    def tearDown(self):
+        adsdb.LOG = None
+        self.connection.close()
+
+    def execute(self, sql, params):
+        cursor = self.connection.cursor()
+        cursor.execute(sql, params)
+        return self.last_select()
+
+    def last_select(self):
+        return [entry for entry in adsdb.LOG if entry[0].startswith('SELECT')][-1]
+
+    def inserted(self, table):
+        return [parameters[0] for operation, parameters in adsdb.LOG
+                if operation == 'INSERT INTO %s (v) VALUES (?)' % table]
+
+    def test_mixed_placeholders(self):
+        sql, params = self.execute(
+            'SELECT id FROM t WHERE a = %s AND id IN (%s, %s, %s, %s, %s) AND b = %s',
+            ['x', 1, 2, 3, 4, 5, 'y'])
+        self.assertEqual(sql, 'SELECT id FROM t WHERE a = ? AND '
+                              'id IN (SELECT v FROM #adsdb_in_1) AND b = ?')
+        self.assertEqual(params, ('x', 'y'))
+        self.assertEqual(self.inserted('#adsdb_in_1'), [1, 2, 3, 4, 5])
+
+    def test_not_in(self):
+        sql, params = self.execute(
+            'SELECT id FROM t WHERE id NOT IN (%s, %s, %s, %s, %s) AND a = %s',
+            [1, 2, 3, 4, 5, 'x'])
+        self.assertEqual(sql, 'SELECT id FROM t WHERE '
+                              'id NOT IN (SELECT v FROM #adsdb_in_1) AND a = ?')
+        self.assertEqual(params, ('x',))
+
+    def test_split_list_uses_one_table(self):
+        list(Item.objects.using('inlist').filter(pk__in=range(10), name='a'))
+        sql, params = self.last_select()
+        self.assertTrue('"bench_app_item"."id" IN (SELECT v FROM #adsdb_in_1)' in sql)
+        self.assertFalse(' OR ' in sql)
+        self.assertEqual(params, ('a',))
+        self.assertEqual(self.inserted('#adsdb_in_1'), range(10))
+
+    def test_excluded_split_list(self):
+        list(Item.objects.using('inlist').exclude(pk__in=range(10)))
+        sql, params = self.last_select()
+        self.assertTrue('NOT' in sql)
+        self.assertTrue('IN (SELECT v FROM #adsdb_in_1)' in sql)
+        self.assertEqual(params, ())
+
+    def test_short_and_mixed_type_lists_are_kept(self):
+        sql, params = self.execute('SELECT id FROM t WHERE id IN (%s, %s)', [1, 2])
+        self.assertEqual(params, (1, 2))
+        sql, params = self.execute(
+            'SELECT id FROM t WHERE id IN (%s, %s, %s, %s, %s)', [1, 'a', 2, 3, 4])
+        self.assertEqual(params, (1, 'a', 2, 3, 4))
+        self.assertFalse([o for o, p in adsdb.LOG if o.startswith('CREATE')])
+
+    def test_tables_are_reused(self):
+        for i in range(2):
+            self.execute('SELECT id FROM t WHERE id IN (%s, %s, %s, %s, %s)',
+                         [1, 2, 3, 4, 5])
+        creates = [o for o, p in adsdb.LOG if o.startswith('CREATE')]
+        self.assertEqual(creates, ['CREATE TABLE #adsdb_in_1 (v integer)'])
+        self.assertTrue(('DELETE FROM #adsdb_in_1', ()) in adsdb.LOG)
+
+    def test_table_statements_skip_cursor_hooks(self):
+        cursor = self.connection.cursor()
+        # Cache the metadata of an empty database
+        adsdb.RESULTS = [[], []]
+        self.connection.introspection.get_table_list(cursor)
+        key = self.connection.introspection._cache_key()
+        generations = self.connection.result_cache.generations(['bench_app_item'])
+        self.execute('SELECT id FROM t WHERE id IN (%s, %s, %s, %s, %s)',
+                     [1, 2, 3, 4, 5])
+        self.assertTrue(key in introspection._metadata)
+        self.assertEqual(self.connection.result_cache.generations(['bench_app_item']),
+                         generations)
+        self.assertFalse(self.connection._primary_pinned)
+
+
+if __name__ == '__main__':
+    unittest.main()
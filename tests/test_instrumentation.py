@@ -0,0 +1,33 @@
+"""
+Tests of the Instrumentation statistics.
+"""
+
+import unittest
+
+import testenv
+
+from adsdb_django.instrumentation import QueryStats, OTHER_STATEMENTS
+
+
+class QueryStatsTests(unittest.TestCase):
+    def test_in_lists_share_a_fingerprint(self):
+        stats = QueryStats()
+        stats.record_execute('SELECT a FROM t WHERE id IN (?, ?) AND b = ?', (1, 2, 3), 0.1)
+        stats.record_execute('SELECT a FROM t WHERE id IN (?,?,?) AND b = ?', (1, 2, 3, 4), 0.1)
+        stats.record_execute('SELECT a FROM t WHERE id IN (4, 5) AND b = ?', (3,), 0.1)
+        self.assertEqual(stats.statements.keys(),
+                         ['SELECT a FROM t WHERE id IN (...) AND b = ?'])
+        self.assertEqual(stats.statements.values()[0].executions, 3)
+
+    def test_fingerprints_are_capped(self):
+        stats = QueryStats(max_statements=3)
+        for i in range(5):
+            stats.record_execute('SELECT a%d FROM t' % i, (), 0.1)
+        stats.record_execute('SELECT a0 FROM t', (), 0.1)
+        self.assertEqual(len(stats.statements), 4)
+        self.assertEqual(stats.statements[OTHER_STATEMENTS].executions, 2)
+        self.assertEqual(stats.statements['SELECT a0 FROM t'].executions, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Tests of the IntrospectionCache option.
+"""
+
+import time
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connection
+
+from adsdb_django import introspection
+
+
+class IntrospectionCacheTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+        # An empty database
+        adsdb.RESULT_ROWS = 0
+        connection.introspection.invalidate()
+
+    def tearDown(self):
+        adsdb.LOG = None
+        adsdb.RESULT_ROWS = 100
+        connection.close()
+
+    def queries(self):
+        return len(adsdb.LOG)
+
+    def test_metadata_expires(self):
+        cursor = connection.cursor()
+        connection.introspection.get_table_list(cursor)
+        read = self.queries()
+        self.assertTrue(read)
+        connection.introspection.get_table_list(cursor)
+        self.assertEqual(self.queries(), read)
+        key = connection.introspection._cache_key()
+        expires, metadata = introspection._metadata[key]
+        self.assertTrue(expires > time.time())
+        introspection._metadata[key] = (time.time() - 1, metadata)
+        connection.introspection.get_table_list(cursor)
+        self.assertEqual(self.queries(), 2 * read)
+
+
+    def test_without_cache_tables_are_queried_one_by_one(self):
+        connection.backend_options['IntrospectionCache'] = False
+        try:
+            cursor = connection.cursor()
+            connection.introspection.get_indexes(cursor, 'bench_app_item')
+            connection.introspection.get_indexes(cursor, 'bench_app_item')
+        finally:
+            connection.backend_options['IntrospectionCache'] = True
+        statements = [operation for operation, parameters in adsdb.LOG]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue("WHERE parent = 'bench_app_item'" in statements[0])
+        self.assertFalse(introspection._metadata)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests of adsdb_django.parallel.
+"""
+
+import threading
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connection, transaction, DatabaseError
+
+from adsdb_django import parallel
+from adsdb_django.util import get_futures
+
+
+class SlowQuerySet(object):
+    "Stands in for a queryset whose evaluation waits for an event."
+    db = 'default'
+
+    def __init__(self, event=None, error=None):
+        self.event = event
+        self.error = error
+
+    def __iter__(self):
+        if self.event is not None:
+            self.event.wait(5)
+        if self.error is not None:
+            raise self.error
+        return iter([1])
+
+
+class EvaluateTests(unittest.TestCase):
+    def setUp(self):
+        if get_futures() is None:
+            self.skipTest("futures is not installed")
+
+    def test_failure_of_later_query_is_raised(self):
+        event = threading.Event()
+        error = DatabaseError('failed')
+        try:
+            try:
+                parallel.evaluate(SlowQuerySet(event), SlowQuerySet(error=error))
+            except DatabaseError, e:
+                self.assertTrue(e is error)
+            else:
+                self.fail("DatabaseError not raised")
+        finally:
+            event.set()
+
+    def test_timeout(self):
+        event = threading.Event()
+        try:
+            self.assertRaises(get_futures().TimeoutError, parallel.evaluate,
+                              SlowQuerySet(event), timeout=0.05)
+        finally:
+            event.set()
+
+    def test_results_in_order(self):
+        self.assertEqual(parallel.evaluate(SlowQuerySet(), SlowQuerySet()),
+                         [[1], [1]])
+
+
+class RunTaskTests(unittest.TestCase):
+    "run_task needs no futures package, it is run in a plain thread here."
+    def setUp(self):
+        adsdb.LOG = []
+
+    def tearDown(self):
+        adsdb.LOG = None
+
+    def run_tasks(self, *tasks):
+        def worker():
+            try:
+                for task in tasks:
+                    parallel.run_task(task, (), {})
+            finally:
+                connection.close()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+
+    def test_idle_connection_is_kept_for_next_task(self):
+        def query():
+            connection.cursor().execute('SELECT 1 FROM system.iota')
+        opened = adsdb.connections
+        self.run_tasks(query, query, query)
+        self.assertEqual(adsdb.connections - opened, 1)
+
+    def test_connection_left_in_transaction_is_closed(self):
+        def leave_open():
+            transaction.enter_transaction_management()
+            transaction.managed(True)
+            connection.cursor().execute('UPDATE t SET a = 1')
+
+        def query():
+            connection.cursor().execute('SELECT 1 FROM system.iota')
+        opened = adsdb.connections
+        self.run_tasks(leave_open, query)
+        self.assertEqual(adsdb.connections - opened, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
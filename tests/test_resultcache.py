@@ -0,0 +1,80 @@
+"""
+Tests of the ResultCacheTables option.
+"""
+
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connections
+
+from adsdb_django.resultcache import PrefetchedResult
+from adsdb_django.util import get_numpy
+
+SQL = 'SELECT id, name, created, price, day FROM bench_app_item'
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+        self.connection = connections['cached']
+        self.connection.result_cache.invalidate()
+
+    def tearDown(self):
+        adsdb.LOG = None
+        adsdb.RESULT_ROWS = 100
+        self.connection.close()
+
+    def selects(self):
+        return len([1 for operation, parameters in adsdb.LOG
+                    if operation.startswith('SELECT')])
+
+    def test_small_result_is_cached(self):
+        adsdb.RESULT_ROWS = 10
+        cursor = self.connection.cursor()
+        cursor.execute(SQL)
+        first = cursor.fetchall()
+        cursor.execute(SQL)
+        self.assertEqual(cursor.fetchall(), first)
+        self.assertEqual(self.selects(), 1)
+
+    def test_fetch_columns_from_cached_result(self):
+        adsdb.RESULT_ROWS = 10
+        cursor = self.connection.cursor()
+        cursor.execute(SQL)
+        rows = cursor.fetchall()
+        for use_numpy in (False, True):
+            if use_numpy and get_numpy() is None:
+                continue
+            cursor.execute(SQL)
+            columns = cursor.fetch_columns(use_numpy=use_numpy)
+            self.assertEqual(list(columns[0].values), [row[0] for row in rows])
+            self.assertEqual(list(columns[3].values), [float(row[3]) for row in rows])
+            if not use_numpy:
+                self.assertEqual(columns[2].values, [row[2] for row in rows])
+        self.assertEqual(self.selects(), 1)
+
+    def test_large_result_is_streamed_and_not_cached(self):
+        adsdb.RESULT_ROWS = 25
+        cursor = self.connection.cursor()
+        cursor.execute(SQL)
+        # Only one row more than fits in the cache was read ahead. Django
+        # wraps the backend's CursorWrapper, which wraps the result.
+        result = cursor.cursor.cursor
+        self.assertTrue(isinstance(result, PrefetchedResult))
+        self.assertEqual(len(result.rows), 11)
+        self.assertEqual(len(cursor.fetchmany(5)), 5)
+        self.assertEqual(len(cursor.fetchmany(10)), 10)
+        rows = cursor.fetchall()
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[-1][0], 24)
+        # Converted like any other result
+        self.assertEqual(str(rows[-1][3]), '24.25')
+        cursor.execute(SQL)
+        self.assertEqual(len(list(cursor)), 25)
+        self.assertEqual(self.selects(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
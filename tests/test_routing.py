@@ -0,0 +1,121 @@
+"""
+Tests of the DataSources read routing.
+"""
+
+import random
+import time
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connections, transaction
+
+from adsdb_django.routing import Node, ReplicaSet
+
+
+def data_source(cursor):
+    "Returns the DataSource of the server that ran the cursor's statement."
+    return cursor.cursor.cursor.connection.kwargs['DataSource']
+
+
+class ReplicaSetTests(unittest.TestCase):
+    def test_choice_favours_fast_and_heavy_nodes(self):
+        slow, fast, heavy = Node('slow', {}), Node('fast', {}), Node('heavy', {}, weight=4)
+        slow.latency, fast.latency, heavy.latency = 0.1, 0.01, 0.1
+        replicas = ReplicaSet([slow, fast, heavy])
+        random.seed(0)
+        for i in range(1500):
+            replicas.choose()
+        self.assertTrue(fast.reads > heavy.reads > slow.reads)
+
+    def test_ejected_node_is_readmitted(self):
+        node = Node('node', {})
+        replicas = ReplicaSet([node], eject_time=30)
+        replicas.eject(node)
+        self.assertEqual(replicas.choose(), None)
+        node.ejected_until = time.time() - 1
+        self.assertTrue(replicas.choose() is node)
+
+
+class RoutingTests(unittest.TestCase):
+    def setUp(self):
+        self.connection = connections['replicas']
+        self.connection.cursor()
+        for node in self.connection.replicas.nodes:
+            node.latency = None
+            node.failures = 0
+            node.ejected_until = 0
+
+    def tearDown(self):
+        adsdb.DOWN = set()
+        self.connection.close()
+
+    def select(self):
+        cursor = self.connection.cursor()
+        cursor.execute('SELECT id FROM bench_app_item')
+        return cursor
+
+    def select_on(self, source):
+        "Runs SELECTs until one runs on the given server, the random choice."
+        for i in range(100):
+            if data_source(self.select()) == source:
+                return
+        self.fail('no SELECT ran on %s' % source)
+
+    def test_reads_go_to_replicas(self):
+        sources = set([data_source(self.select()) for i in range(50)])
+        self.assertEqual(sources, set(['replica1.add', 'replica2.add']))
+
+    def test_write_pins_primary_until_closed(self):
+        self.connection.cursor().execute('UPDATE bench_app_item SET price = 1')
+        self.assertEqual(data_source(self.select()), 'test.add')
+        self.connection.close()
+        self.assertNotEqual(data_source(self.select()), 'test.add')
+
+    def test_transaction_stays_on_primary(self):
+        transaction.enter_transaction_management(using='replicas')
+        transaction.managed(True, using='replicas')
+        try:
+            self.assertEqual(data_source(self.select()), 'test.add')
+        finally:
+            transaction.rollback(using='replicas')
+            transaction.leave_transaction_management(using='replicas')
+
+    def test_failed_node_is_ejected(self):
+        adsdb.DOWN = set(['replica1.add'])
+        sources = [data_source(self.select()) for i in range(20)]
+        self.assertFalse('replica1.add' in sources)
+        self.assertTrue('test.add' in sources)
+        stats = self.connection.replicas.stats()
+        self.assertEqual(stats['replica1.add']['failures'], 1)
+        self.assertTrue(stats['replica1.add']['ejected_until'] > time.time())
+
+    def test_dropped_idle_connection_is_reopened(self):
+        self.select_on('replica1.add')
+        node = self.connection.replicas.nodes[0]
+        self.connection.replica_connection(node).dropped = True
+        opened = adsdb.connections
+        self.select_on('replica1.add')
+        self.assertEqual(adsdb.connections - opened, 1)
+        self.assertEqual(node.failures, 0)
+        self.assertEqual(node.ejected_until, 0)
+
+    def test_latency_excludes_connect(self):
+        connect = adsdb.connect
+        def slow_connect(**kwargs):
+            time.sleep(0.05)
+            return connect(**kwargs)
+        adsdb.connect = slow_connect
+        try:
+            self.select()
+        finally:
+            adsdb.connect = connect
+        latencies = [node.latency for node in self.connection.replicas.nodes
+                     if node.latency is not None]
+        self.assertEqual(len(latencies), 1)
+        self.assertTrue(latencies[0] < 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Nesting of atomic blocks with each other and with Django's transaction
+management.
+"""
+
+import unittest
+
+import testenv
+
+import adsdb
+from django.db import connection, transaction
+
+from adsdb_django.transaction import atomic
+
+
+class Failure(Exception):
+    pass
+
+
+class AtomicTests(unittest.TestCase):
+    def setUp(self):
+        adsdb.LOG = []
+
+    def tearDown(self):
+        adsdb.LOG = None
+        connection.close()
+
+    def statements(self):
+        return [operation for operation, parameters in adsdb.LOG]
+
+    def update(self, value):
+        connection.cursor().execute('UPDATE t SET a = %s', [value])
+
+    def test_outermost_block_commits(self):
+        with atomic():
+            self.update(1)
+        self.assertEqual(self.statements(),
+                         ['BEGIN TRANSACTION', 'UPDATE t SET a = ?', 'COMMIT'])
+
+    def test_inner_block_rolls_back_to_savepoint(self):
+        with atomic():
+            self.update(1)
+            try:
+                with atomic():
+                    self.update(2)
+                    raise Failure
+            except Failure:
+                pass
+        statements = self.statements()
+        self.assertEqual(statements[-1], 'COMMIT')
+        self.assertTrue(statements[4].startswith('ROLLBACK TO SAVEPOINT'))
+        self.assertFalse('ROLLBACK' in statements)
+
+    def test_atomic_inside_commit_on_success_leaves_commit_to_it(self):
+        @transaction.commit_on_success
+        def outer():
+            self.update(1)
+            with atomic():
+                self.update(2)
+            raise Failure
+        self.assertRaises(Failure, outer)
+        statements = self.statements()
+        self.assertFalse('COMMIT' in statements)
+        self.assertEqual(statements[-1], 'ROLLBACK')
+
+    def test_failing_atomic_inside_commit_on_success_keeps_outer_work(self):
+        @transaction.commit_on_success
+        def outer():
+            self.update(1)
+            try:
+                with atomic():
+                    self.update(2)
+                    raise Failure
+            except Failure:
+                pass
+        outer()
+        statements = self.statements()
+        self.assertFalse('ROLLBACK' in statements)
+        self.assertTrue([s for s in statements if s.startswith('ROLLBACK TO SAVEPOINT')])
+        self.assertEqual(statements[-1], 'COMMIT')
+
+
+if __name__ == '__main__':
+    unittest.main()
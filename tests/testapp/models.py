@@ -0,0 +1,7 @@
+from django.db import models
+
+from bench_app.models import Item
+
+class Part(models.Model):
+    item = models.ForeignKey(Item)
+    name = models.CharField(max_length=50)
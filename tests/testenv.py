@@ -0,0 +1,20 @@
+"""
+Sets up the tests: Django settings from tests/settings.py and the adsdb
+stand-in from benchmarks/fake, so that no Advantage server is needed.
+Import it before Django in every test module.
+"""
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+
+# In order of precedence; the tests' settings module shadows the benchmarks'
+for path in reversed([TESTS_DIR, os.path.join(ROOT_DIR, 'benchmarks'),
+                      os.path.join(ROOT_DIR, 'benchmarks', 'fake'), ROOT_DIR]):
+    if path in sys.path:
+        sys.path.remove(path)
+    sys.path.insert(0, path)
+
+os.environ['DJANGO_SETTINGS_MODULE'] = 'settings'